@@ -5,27 +5,48 @@ Authors:
     Sanyam Mehra (CS229 teaching staff): HW4 solutions
 """
 
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-from keyboard_event_generator import PressString, LeftClick
+from transitions import make_transitions
+from solvers import value_iteration, gauss_seidel, modified_policy_iteration, linear_policy_iteration, prioritized_sweeping, greedy_policy
+from discretizer import Discretizer, STATE_AXES
+from transition_log import TransitionLogWriter
+from bird import saturation_time
+from util import make_rng, AGENT_STREAM
 
 
 class AIAgent:
     """AI agent controlling the bird.
     The AI agent is trained by Reinforcement Learning.
+    The agent does not interact with the Game by itself: the Game (or the headless Simulator) applies the chosen 'action' and feeds back the transition.
     Every time the agent finishes a simulation, he builds an approximate Markov Decision Process based on the transition and the reward observed.
     At the end of the simulation, he computes the approximated value function through Value Iteration.
     This value function is then used to choose the best actions of the next simulation.
+    With 'async_solve', the MDP is solved in a background thread while the next simulations are played with the previous policy.
     
     Attributes:
         'args' (ArgumentParser): parser gethering all the Game parameters
-        'n_states' (tuple of int, (n_y, n_dx, n_dy)): discretization = number of points in each axis of the state
+        'state_axes' (tuple of str): components of the state discretized by the agent, among ("y", "dx", "dy", "t")
+        'n_states' (tuple of int): discretization = number of points in each axis of 'state_axes'
         'gamma' (float): discount factor
         'eps' (float): epsilon-greedy coefficient
         'mdp' (MDP): approximate MDP current parameters
         'n_sim' (int): number of simulations
+        'n_iter' (int): number of iterations of the last solve of the MDP (see the solver chosen by 'solver')
+        'solve_time' (float): wall time of the last solve of the MDP (in seconds)
+        'rng' (np.random.Generator): random stream of the exploration, derived from the master seed 'args.seed'
+        'solve_executor' (ThreadPoolExecutor): background thread solving the MDP (None if not 'async_solve')
+        'solve_future' (Future): solve in progress in the background thread (None if no solve is in progress)
+        'pending_counts' (tuple of list, (s, a, new_s, reward)): transitions observed during the background solve, recorded once it is swapped in
+        'transition_log' (TransitionLogWriter): log of the raw transitions played by the agent (None if not 'transition_log')
         
-        'state' (np.array, [y, dx, dy]): the current state of the Bird
+        'discretizer' (Discretizer): discretization of the state, built on the grids 'mdp_data['state_discretization']'
+        'state' (np.array, [y, dx, dy, t]): the current state of the Bird
+        'state_idx' (int): index of the closest discretized state of the current state
         'action' (int): the current action 
                 action = 1 if jumping, 0 otherwise
     """
@@ -35,17 +56,31 @@ class AIAgent:
         
         # RL parameters
         self.args = args
-        self.n_states = args.n_states
+        self.state_axes = tuple(args.state_axes)
+        self.n_states = tuple(args.n_states)
         self.gamma = args.gamma
         self.eps = 1.
         self.tolerance = args.tolerance
+        self.rng = make_rng(args.seed, AGENT_STREAM)
         # initialize the approximate MDP parameters
         self.initialize_mdp_data()
         # current simulation
         self.n_sim = 1
+        self.n_iter = 0
+        self.solve_time = 0.
+        # background solve of the MDP
+        self.solve_executor = ThreadPoolExecutor(max_workers=1) if args.async_solve else None
+        self.solve_future = None
+        self.pending_counts = ([], [], [], [])
+        # raw transitions, to replay them offline
+        self.transition_log = TransitionLogWriter(args.transition_log, args.seed) if args.transition_log is not None else None
+        if self.transition_log is not None:
+            # the buffered records and the index are written however the process exits (window closed, Ctrl-C)
+            atexit.register(self.close)
         
         # current state and action
         self.state = state
+        self.state_idx = self.get_closest_state_idx(state) if state is not None else None
         self.action = 0
 
     def get_reward(self, isScoreUpdated, isFail):
@@ -74,19 +109,21 @@ class AIAgent:
     
     def choose_action(self):
         """Choose the next action with an Epsilon-Greedy exploration strategy.
+        
+        Return:
+            'action' (int, 0 or 1): the chosen action
+                    action = 1 if jumping, 0 otherwise
         """
-        def jump():
-            """Execute the jumping action.
-            """
-            PressString(" ")
+        # swap in the policy of the background solve as soon as it is available
+        if self.solve_future is not None and self.solve_future.done():
+            self.swap_mdp_solution()
         
-        if np.random.rand() < self.eps:            
-            self.action = self.best_action(self.state)
+        if self.rng.random() < self.eps:            
+            self.action = self.best_action(self.state, self.state_idx)
         else:
-            self.action = np.random.rand() < 0.01
+            self.action = int(self.rng.random() < 0.01)
             
-        if self.action == 1:
-            jump()
+        return self.action
     
     def reset(self, state):
         """Reset the simulation parameters.
@@ -95,41 +132,42 @@ class AIAgent:
 
         # initial state and action
         self.state = state
+        self.state_idx = self.get_closest_state_idx(state) if state is not None else None
         
         # make the algorithm more greedy
         self.eps += 0.01
-        
-        # start a new simulation
-        LeftClick()
     
     def set_transition(self, new_state, isScoreUpdated, isFail):
         """Update the approximate MDP with the given transition.
         
         Args:
-            'new_state' (np.array, [y, dx, dy]): the new state of the Bird
+            'new_state' (np.array, [y, dx, dy, t]): the new state of the Bird
             'isScoreUpdated' (bool): whether the agent has earned a point at the last state
             'isFail' (bool): whether the Game has been failed at the last state
         """
         # get the previous state reward
         reward = self.get_reward(isScoreUpdated, isFail)
+        # each state is discretized once: the new state index is kept for the next time step
+        new_state_idx = self.get_closest_state_idx(new_state)
         # store the given transition
-        self.update_mdp_counts(self.state, self.action, new_state, reward, isFail)
+        self.record_transition(self.state_idx, self.action, (not isFail)*new_state_idx, reward)
+        if self.transition_log is not None:
+            self.transition_log.append(self.state, self.action, new_state, reward, isFail)
         
         # update the current state
         self.state = new_state
+        self.state_idx = new_state_idx
         
         # end of the current simulation 
         if isFail:
             # update the approximate MDP with the simulation observations
-            self.update_mdp_parameters()
-            # start a new simulation
-            PressString("n")
+            self.schedule_mdp_update()
     
     def get_closest_state_idx(self, state, isFail=False):
         """Get the index of the closest discretized state.
         
         Args:
-            'state' (np.array, [y, dx, dy]): the current state of the Bird
+            'state' (np.array, [y, dx, dy, t]): the current state of the Bird
             'isFail' (bool): whether the Game is failed
             
         Return:
@@ -138,22 +176,33 @@ class AIAgent:
         Remarks:
             State 0 is a FAIL state.
         """
-        # discretized state
-        y_s, dx_s, dy_s = self.mdp_data["state_discretization"]
-        
-        # closest discretized state indices
-        i = np.argmin(abs(y_s - state[0]))
-        j = np.argmin(abs(dx_s - state[1]))
-        k = np.argmin(abs(dy_s - state[2]))
+        return int(self.discretizer.get_state_idx(state, isFail))
+
+    def get_closest_states_idx(self, states, isFail=False):
+        """Get the indices of the closest discretized states of a batch of states.
+        Vectorized version of 'get_closest_state_idx'.
         
-        return (not isFail)*(j*self.n_states[2] + k + 1)
+        Args:
+            'states' (np.array, shape=(n, 4)): the current states of n Birds
+            'isFail' (np.array, shape=(n,), dtype=bool): whether each Game is failed
+            
+        Return:
+            'ind' (np.array, shape=(n,), dtype=int): indices of the closest discretized states
+        """
+        return self.discretizer.get_state_idx(states, isFail)
 
     def initialize_mdp_data(self):
         """Save a attributes 'mdp_data' that contains all the parameters defining the approximate MDP.
         
         Parameters:
             'num_states' (int): the number of discretized states.
-                    num_states = n_dx*n_dy + 1
+                    num_states = prod(n_states) + 1
+            'state_axes' (list of str): components of the state discretized on each grid of 'state_discretization'
+        
+            'transitions' (DenseTransitions or SparseTransitions): transition model, stored as chosen by 'mdp_backend'
+            'q_values' (np.array, shape=(num_states, 2)): expected next value of each state and action
+            'policy' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+                    'q_values' and 'policy' are computed after each solve: choosing an action is a table lookup
         
         Initialization scheme:
             - Value function array initialized to 0
@@ -161,54 +210,84 @@ class AIAgent:
             - State rewards initialized to 0
         """
         
-        # state discretization
-        num_states = self.n_states[1]*self.n_states[2] + 1
-        y_s = np.linspace(0, self.args.window_size[0]-self.args.ground_height, self.n_states[0])
-        dx_s = np.linspace(0, self.args.pipe_dist[0], self.n_states[1])
-        dy_s = np.linspace(-(self.args.window_size[0]-self.args.ground_height), self.args.window_size[0]-self.args.ground_height, self.n_states[2])
+        # state discretization: one uniform grid per axis
+        if len(self.n_states) != len(self.state_axes):
+            raise ValueError("'n_states' should give one number of points per axis of 'state_axes': got {} for {}".format(self.n_states, self.state_axes))
+        state_ranges = self.get_state_ranges()
+        state_discretization = [np.linspace(low, high, n) for (low, high), n in zip(state_ranges, self.n_states)]
+        discretizer = Discretizer(state_discretization, [STATE_AXES.index(axis) for axis in self.state_axes])
+        num_states = discretizer.num_states
         
         # OLD version of the state
         #self.d_s = np.linspace(0, np.sqrt((self.args.window_size[0]-self.args.ground_height)**2 + self.args.pipe_dist[0]**2), self.n_d)
         #self.theta_s = np.linspace(-np.pi/2, np.pi/2, self.n_theta)
         #num_states = s2*elf.n_d*self.n_theta
 
-        transition_counts = np.zeros((num_states, 2, num_states))
-        transition_probs = np.ones((num_states, 2, num_states)) / num_states
+        transitions = make_transitions(self.args.mdp_backend, num_states)
         reward_counts = np.zeros((num_states, 2))
         reward = np.zeros(num_states)
         value = np.zeros(num_states)
 
+        q_values, policy = greedy_policy(transitions, value)
+
         self.mdp_data = {
             'num_states': num_states,
-            'state_discretization': [y_s, dx_s, dy_s],
-            'transition_counts': transition_counts,
-            'transition_probs': transition_probs,
+            'state_axes': list(self.state_axes),
+            'state_discretization': state_discretization,
+            'transitions': transitions,
             'reward_counts': reward_counts,
             'reward': reward,
-            'value': value
+            'value': value,
+            'q_values': q_values,
+            'policy': policy
         }
+        self.discretizer = discretizer
 
-    def best_action(self, state):
+    def get_state_ranges(self):
+        """Get the range of each axis of the discretized state.
+        
+        Return:
+            'state_ranges' (list of tuple of float, (low, high)): range of each axis of 'state_axes'
+            
+        Remarks:
+            The default ranges cover the reachable values:
+                - 'y': from the top of the window to the floor ;
+                - 'dx': from the end of a pipe to the front of the next one ;
+                - 'dy': from minus to plus the height of the window above the floor ;
+                - 't': from the jump to the saturation of the falling velocity.
+        """
+        if self.args.state_ranges is not None:
+            if len(self.args.state_ranges) != 2*len(self.state_axes):
+                raise ValueError("'state_ranges' should give one pair (low, high) per axis of 'state_axes': got {} for {}".format(self.args.state_ranges, self.state_axes))
+            return list(zip(self.args.state_ranges[::2], self.args.state_ranges[1::2]))
+        
+        H = self.args.window_size[0] - self.args.ground_height
+        default_ranges = {
+            'y': (0, H),
+            'dx': (0, self.args.pipe_dist[0]),
+            'dy': (-H, H),
+            't': (0, saturation_time(self.args))
+        }
+        
+        return [default_ranges[axis] for axis in self.state_axes]
+
+    def best_action(self, state, s=None):
         """Choose the next action (0 or 1) that is optimal according to your current 'mdp_data'. 
         When there is no optimal action, return 0 has "not jumping" is more frequent.
         
         Args:
-            'state' (np.array, [y, dx, dy]): current state of the Bird
+            'state' (np.array, [y, dx, dy, t]): current state of the Bird
+            's' (int, default=None): index of the closest discretized state, if already known
             
         Return:
             'action' (int, 0 or 1): optimal action in the current state according to the approximate MDP
         """
         # get the index of the closest discretized state
-        s = self.get_closest_state_idx(state)
+        if s is None:
+            s = self.get_closest_state_idx(state)
         
-        # value function if taking each action in the current state 
-        score_nojump = self.mdp_data['transition_probs'][s, 0, :].dot(self.mdp_data['value'])
-        score_jump = self.mdp_data['transition_probs'][s, 1, :].dot(self.mdp_data['value'])
-
-        # best action in the current state
-        action = (score_jump > score_nojump)*1
-
-        return action
+        # best action in the current state, precomputed after the last solve
+        return int(self.mdp_data['policy'][s])
 
     def update_mdp_counts(self, state, action, new_state, reward, isFail):
         """Update the transition counts and reward counts based on the given transition.
@@ -218,52 +297,209 @@ class AIAgent:
             - the rewards accumulated for every `new_state`.
         
         Args:
-            'state' (np.array, [y, dx, dy]): previous state of the Bird
+            'state' (np.array, [y, dx, dy, t]): previous state of the Bird
             'action' (int, 0 or 1): last action performed
-            'new_state' (np.array, [y, dx, dy]): new state after performing the action in the previous state
+            'new_state' (np.array, [y, dx, dy, t]): new state after performing the action in the previous state
             'reward' (float): reward observed in the previous state
         """
         # get the index of the closest discretized previous and new states
         s = self.get_closest_state_idx(state, False)
         new_s = self.get_closest_state_idx(new_state, isFail)
 
+        self.record_transition(s, action, new_s, reward)
+
+    def record_transition(self, s, action, new_s, reward):
+        """Update the transition counts and reward counts based on the given transition between discretized states.
+        
+        Args:
+            's' (int): index of the discretized previous state
+            'action' (int, 0 or 1): last action performed
+            'new_s' (int): index of the discretized new state (0 if the Game is failed)
+            'reward' (float): reward observed in the previous state
+        """
+        # the counts belong to the background solve: record the transition once it is swapped in
+        if self.solve_future is not None:
+            for pending, x in zip(self.pending_counts, (s, action, new_s, reward)):
+                pending.append(x)
+            return
+        
         # update the transition and the reward counts
-        self.mdp_data['transition_counts'][s, action, new_s] += 1
+        self.mdp_data['transitions'].add(s, action, new_s)
         self.mdp_data['reward_counts'][new_s, 0] += reward
         self.mdp_data['reward_counts'][new_s, 1] += 1
 
+    def choose_actions(self, states):
+        """Choose the next actions of a batch of Birds with an Epsilon-Greedy exploration strategy.
+        Vectorized version of 'choose_action'.
+        
+        Args:
+            'states' (np.array, shape=(n, 4)): the current states of n Birds
+        
+        Return:
+            'actions' (np.array, shape=(n,), dtype=int): the chosen actions
+        """
+        # get the indices of the closest discretized states
+        s = self.get_closest_states_idx(states)
+        
+        # best actions in the current states, precomputed after the last solve
+        best_actions = self.mdp_data['policy'][s]
+        
+        # random actions
+        n = states.shape[0]
+        random_actions = (self.rng.random(n) < 0.01)*1
+        
+        return np.where(self.rng.random(n) < self.eps, best_actions, random_actions)
+    
+    def update_mdp_counts_batch(self, states, actions, new_states, isScoreUpdated, isFail):
+        """Update the transition counts and reward counts based on a batch of transitions.
+        Vectorized version of 'update_mdp_counts'.
+        
+        Args:
+            'states' (np.array, shape=(n, 4)): previous states of the Birds
+            'actions' (np.array, shape=(n,)): last actions performed
+            'new_states' (np.array, shape=(n, 4)): new states after performing the actions in the previous states
+            'isScoreUpdated' (np.array, shape=(n,), dtype=bool): whether each agent has earned a point at the previous state
+            'isFail' (np.array, shape=(n,), dtype=bool): whether each Game has been failed at the previous state
+        """
+        # rewards observed in the previous states (see 'get_reward')
+        rewards = np.where(isScoreUpdated, 100, np.where(isFail, -1000, 1))
+        
+        # get the indices of the closest discretized previous and new states
+        s = self.get_closest_states_idx(states)
+        new_s = self.get_closest_states_idx(new_states, isFail)
+        
+        self.record_transitions(s, actions, new_s, rewards)
+        if self.transition_log is not None:
+            self.transition_log.append_batch(states, actions, new_states, rewards, isFail)
+
+    def record_transitions(self, s, actions, new_s, rewards):
+        """Update the transition counts and reward counts based on a batch of transitions between discretized states.
+        Vectorized version of 'record_transition'.
+        
+        Args:
+            's' (np.array of int): indices of the discretized previous states
+            'actions' (np.array of int): last actions performed
+            'new_s' (np.array of int): indices of the discretized new states (0 if the Game is failed)
+            'rewards' (np.array): rewards observed in the previous states
+        """
+        # the counts belong to the background solve: record the transitions once it is swapped in
+        if self.solve_future is not None:
+            for pending, x in zip(self.pending_counts, (s, actions, new_s, rewards)):
+                pending.extend(np.asarray(x).tolist())
+            return
+        
+        # update the transition and the reward counts: repeated indices are accumulated
+        self.mdp_data['transitions'].add(s, actions, new_s)
+        np.add.at(self.mdp_data['reward_counts'][:, 0], new_s, rewards)
+        np.add.at(self.mdp_data['reward_counts'][:, 1], new_s, 1)
+
     def update_mdp_parameters(self):
         """Update the estimated MDP parameters (transition and reward functions) at the end of a simulation.
-        Perform value iteration using the new estimated model for the MDP.
+        Solve for the value function using the new estimated model for the MDP, with the solver chosen by 'solver'.
+        The solve is synchronous: see 'schedule_mdp_update' for the background solve.
+        """
+        # a background solve owns the counts: wait for it first
+        self.wait_mdp_update()
+
+        self.set_mdp_solution(*self.solve_mdp())
+
+    def schedule_mdp_update(self):
+        """Update the approximate MDP at the end of a simulation, in the background thread if 'async_solve'.
+
+        Remarks:
+            The background solve works on the counts observed until now: the transitions observed meanwhile are kept apart,
+            and the next simulations are played with the previous policy until the new one is swapped in (see 'choose_action').
+            A simulation finished during a background solve does not start a new one: its observations are solved with the next simulation's.
+        """
+        if self.solve_executor is None:
+            self.update_mdp_parameters()
+            return
+
+        if self.solve_future is not None:
+            if not self.solve_future.done():
+                return
+            self.swap_mdp_solution()
+
+        self.solve_future = self.solve_executor.submit(self.solve_mdp)
+
+    def close(self):
+        """Finish the background work of the agent: wait for the solve in progress and write the transition log."""
+        self.wait_mdp_update()
+        if self.transition_log is not None:
+            self.transition_log.close()
+            self.transition_log = None
+
+    def wait_mdp_update(self):
+        """Wait for the background solve in progress (if any) and swap in its solution."""
+        if self.solve_future is not None:
+            self.swap_mdp_solution()
+
+    def swap_mdp_solution(self):
+        """Swap in the solution of the background solve, then record the transitions observed meanwhile."""
+        solution = self.solve_future.result()
+        self.solve_future = None
+        self.set_mdp_solution(*solution)
+
+        # the counts are no longer used by the solver
+        s, actions, new_s, rewards = (np.array(pending, dtype=int if k < 3 else float) for k, pending in enumerate(self.pending_counts))
+        self.pending_counts = ([], [], [], [])
+        self.record_transitions(s, actions, new_s, rewards)
+
+    def set_mdp_solution(self, reward, value, q_values, policy, n_iter, solve_time):
+        """Replace the solution of the approximate MDP (see 'solve_mdp'): each array is replaced, never modified in place."""
+        self.mdp_data.update({'reward': reward, 'value': value, 'q_values': q_values, 'policy': policy})
+        self.n_iter = n_iter
+        self.solve_time = solve_time
+
+    def solve_mdp(self):
+        """Update the estimated MDP parameters (transition and reward functions) with the counts.
+        Solve for the value function using the new estimated model for the MDP, with the solver chosen by 'solver':
+            - 'value_iteration': full sweeps of Value Iteration ;
+            - 'gauss_seidel': in-place sweeps of Value Iteration, by blocks of states ;
+            - 'policy_iteration': Modified Policy Iteration, with 'eval_sweeps' evaluation sweeps per policy improvement ;
+            - 'linear': Policy Iteration, each policy being evaluated exactly by a linear solve ;
+            - 'prioritized_sweeping': only update the states affected by the new observations.
+        All the solvers start from the previous solution.
+
+        Return:
+            'reward' (np.array, shape=(num_states,)): new reward function
+            'value' (np.array, shape=(num_states,)): new value function
+            'q_values' (np.array, shape=(num_states, 2)): expected next value of each state and action
+            'policy' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+            'n_iter' (int): number of iterations of the solve
+            'solve_time' (float): wall time of the solve (in seconds)
 
         Remarks:
             Only observed transitions are updated.
             Only states with observed rewards are updated.
+            The solution is returned instead of stored: it can be computed in the background thread while the previous one is used.
         """
-        temp = self.mdp_data['transition_probs'].copy()
+        start = time.perf_counter()
+
         # update the transition function
-        total_num_transitions = np.sum(self.mdp_data['transition_counts'], axis=-1)
-        visited_state_action_pairs = total_num_transitions > 0
-        self.mdp_data['transition_probs'][visited_state_action_pairs] = self.mdp_data['transition_counts'][visited_state_action_pairs] / total_num_transitions[visited_state_action_pairs, np.newaxis]
+        touched_states = self.mdp_data['transitions'].update_probs()
 
         # update the reward function
         visited_states = self.mdp_data['reward_counts'][:, 1] > 0
-        self.mdp_data['reward'][visited_states] = self.mdp_data['reward_counts'][visited_states, 0] / self.mdp_data['reward_counts'][visited_states, 1]
-
-        # update the value function through Value Iteration
-        while True:           
-            # Q(_,a) for the different actions
-            value_nojump = np.dot(self.mdp_data['transition_probs'][:,0,:], self.mdp_data['value'])
-            value_jump = np.dot(self.mdp_data['transition_probs'][:,1,:], self.mdp_data['value'])
+        reward = self.mdp_data['reward'].copy()
+        reward[visited_states] = self.mdp_data['reward_counts'][visited_states, 0] / self.mdp_data['reward_counts'][visited_states, 1]
+        changed_states = np.flatnonzero(reward != self.mdp_data['reward'])
 
-            # Bellman update
-            new_value = self.mdp_data['reward'] + self.gamma * np.maximum(value_nojump, value_jump)
-            
-            # difference with previous value function
-            max_diff = np.max(np.abs(new_value - self.mdp_data['value']))
+        # update the value function
+        transitions = self.mdp_data['transitions']
+        if self.args.solver == "prioritized_sweeping":
+            seeds = np.concatenate([touched_states, changed_states])
+            value, n_iter = prioritized_sweeping(transitions, reward, self.mdp_data['value'], self.gamma, self.tolerance, seeds)
+        elif self.args.solver == "gauss_seidel":
+            value, n_iter = gauss_seidel(transitions, reward, self.mdp_data['value'], self.gamma, self.tolerance)
+        elif self.args.solver == "policy_iteration":
+            value, n_iter = modified_policy_iteration(transitions, reward, self.mdp_data['value'], self.gamma, self.tolerance, self.args.eval_sweeps)
+        elif self.args.solver == "linear":
+            value, n_iter = linear_policy_iteration(transitions, reward, self.mdp_data['value'], self.gamma, self.tolerance)
+        else:
+            value, n_iter = value_iteration(transitions, reward, self.mdp_data['value'], self.gamma, self.tolerance)
+        
+        # greedy policy of the new value function
+        q_values, policy = greedy_policy(transitions, value)
 
-            self.mdp_data['value'] = new_value
-            
-            # check for convergence
-            if max_diff < self.tolerance:
-                break
+        return reward, value, q_values, policy, n_iter, time.perf_counter() - start
@@ -6,9 +6,15 @@ Authors:
 
 import argparse
 
+import numpy as np
 
-def get_game_args():
-    """Get arguments needed to play the Game."""
+
+def get_game_args(argv=None):
+    """Get arguments needed to play the Game.
+    
+    Args:
+        'argv' (list of str, default=None): command-line arguments to parse (the arguments of the script if None)
+    """
     
     parser = argparse.ArgumentParser('Get arguments needed to play the Game.')
     
@@ -20,6 +26,12 @@ def get_game_args():
     add_sprites_args(parser)
     # add arguments relative to the RL algorithm     
     add_RL_args(parser)
+    # add arguments relative to the headless training
+    add_training_args(parser)
+    # add arguments relative to the pixel observations
+    add_observation_args(parser)
+    # add arguments relative to the planning agent
+    add_planner_args(parser)
     
     parser.add_argument('--commands_filename',
                         type=str,
@@ -32,8 +44,13 @@ def get_game_args():
     parser.add_argument('--agent',
                         type=str,
                         default="human",
-                        choices=("human", "ai"),
-                        help="Whether to use a human or an AI agent.")
+                        choices=("human", "ai", "planner"),
+                        help="Whether to use a human, an AI agent (learned MDP) or a planning agent (see 'planner.py').")
+    
+    parser.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help="Master seed of the random streams (pipes and exploration). Drawn at random and printed if not given: it is also saved with the agent and the transition log.")
     
     parser.add_argument('--n_frames_human',
                         type=int,
@@ -43,19 +60,110 @@ def get_game_args():
                         type=int,
                         default=10,
                         help="How often to display a new frame when an AI is playing: 1 frame every 'n_frames_ai'.")
+
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="Time the phases of each time step of the Game: the summary is printed on exit (or by pressing P).")
+    parser.add_argument('--profile_trace',
+                        type=str,
+                        default=None,
+                        help="File where the Chrome trace of the profiled phases is written on exit (if '--profile').")
                         
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    
+    # draw a master seed: every random stream is derived from it, the run can be reproduced with '--seed'
+    if args.seed is None:
+        args.seed = int(np.random.SeedSequence().entropy % 2**32)
+        print("Master seed: {} (reproduce the run with '--seed {}')".format(args.seed, args.seed))
 
     return args
 
 
+def add_training_args(parser):
+    """Add arguments relative to the headless training of the AI agent."""
+    parser.add_argument('--n_episodes',
+                        type=int,
+                        default=1000,
+                        help="Number of games played by the AI agent during the headless training.")
+    parser.add_argument('--n_games',
+                        type=int,
+                        default=1,
+                        help="Number of games simulated at once by the vectorized BatchEnvironment during the headless training.")
+    parser.add_argument('--n_workers',
+                        type=int,
+                        default=1,
+                        help="Number of rollout worker processes playing games for a central learner (see 'rollout.py').")
+    parser.add_argument('--episodes_per_task',
+                        type=int,
+                        default=10,
+                        help="Number of games played by a rollout worker before sending its transition counts to the learner.")
+    parser.add_argument('--offline_logs',
+                        type=str,
+                        default=None,
+                        nargs='+',
+                        help="Directories of the transition logs the AI agent is trained on by the offline training (see 'offline_train.py').")
+    parser.add_argument('--log_every',
+                        type=int,
+                        default=100,
+                        help="How often to print the training progress: 1 line every 'log_every' games.")
+
+
+def add_observation_args(parser):
+    """Add arguments relative to the pixel observations of the Game (see 'observation.py')."""
+    parser.add_argument('--obs_dims',
+                        type=int,
+                        default=(84, 84),
+                        nargs=2,
+                        help="Dimensions (H, W) of the grayscale frames observed by a pixel-based agent.")
+    parser.add_argument('--frame_stack',
+                        type=int,
+                        default=4,
+                        help="Number of last frames stacked in an observation.")
+    parser.add_argument('--frame_skip',
+                        type=int,
+                        default=4,
+                        help="Number of time steps played for each action of a pixel-based agent: only the last frame is observed.")
+
+
+def add_planner_args(parser):
+    """Add arguments relative to the planning agent (see 'planner.py')."""
+    parser.add_argument('--plan_horizon',
+                        type=int,
+                        default=100,
+                        help="Maximum number of time steps of the futures planned by the planning agent.")
+    parser.add_argument('--beam_width',
+                        type=int,
+                        default=64,
+                        help="Maximum number of futures kept at each time step of the beam search.")
+    parser.add_argument('--plan_budget',
+                        type=float,
+                        default=10.,
+                        help="Maximum planning time per time step (in milliseconds): the search stops at the reached depth.")
+
+
 def add_RL_args(parser):
     """Add arguments relative to the Reinforcement Learning algorithm."""
+    parser.add_argument('--state_axes',
+                        type=str,
+                        default=("dx", "dy"),
+                        nargs='+',
+                        choices=("y", "dx", "dy", "t"),
+                        help="Components of the state discretized by the AI agent ('t' = number of time steps since the last jump). Each added axis multiplies the number of states and the cost of the solves.")
     parser.add_argument('--n_states',
                         type=int,
-                        default=(15, 5, 15),
-                        nargs=3,
-                        help="Discretization = number of points in each axis of the state.")
+                        default=(5, 15),
+                        nargs='+',
+                        help="Discretization = number of points in each axis of the state (one per 'state_axes').")
+    parser.add_argument('--state_ranges',
+                        type=float,
+                        default=None,
+                        nargs='+',
+                        help="Range (low, high) of each axis of the state (one pair per 'state_axes'). Defaults to the reachable range of each axis.")
+    parser.add_argument('--mdp_backend',
+                        type=str,
+                        default="dense",
+                        choices=("dense", "sparse"),
+                        help="Storage of the MDP transition model: dense arrays or sparse counts (for large numbers of states).")
     parser.add_argument('--gamma',
                         type=float,
                         default=0.995,
@@ -64,18 +172,37 @@ def add_RL_args(parser):
                         type=float,
                         default=1.,
                         help="Epsilon-greedy coefficient.")
+    parser.add_argument('--solver',
+                        type=str,
+                        default="value_iteration",
+                        choices=("value_iteration", "gauss_seidel", "policy_iteration", "linear", "prioritized_sweeping"),
+                        help="Solver of the approximate MDP at the end of each simulation (see 'AIAgent.solve_mdp'). 'linear' solves a dense linear system, or a sparse one with scipy if '--mdp_backend sparse'.")
     parser.add_argument('--tolerance',
                         type=float,
                         default=0.01,
-                        help="Convergence criterium for Value Iteration.")
+                        help="Convergence criterium of the solver: largest change of the value function in a sweep.")
+    parser.add_argument('--eval_sweeps',
+                        type=int,
+                        default=20,
+                        help="Number of policy evaluation sweeps after each policy improvement of the 'policy_iteration' solver.")
+    parser.add_argument('--async_solve',
+                        action='store_true',
+                        help="Whether to solve the MDP in a background thread: the next games are played with the previous policy meanwhile (the training is then no longer reproducible).")
     parser.add_argument('--save_filename',
                         type=str,
-                        default='ai_save.json',
-                        help="Name of the JSON file saving the agent parameters.")
+                        default='ai_save.ckpt',
+                        help="Name of the binary checkpoint file saving the agent parameters (former JSON saves can still be loaded).")
+    parser.add_argument('--compress_save',
+                        action='store_true',
+                        help="Whether to compress the saved agent parameters (the checkpoint can then not be memory-mapped).")
     parser.add_argument('--load_save',
                         type=bool,
                         default=False,
                         help="Whether to load the agent parameters from the saved file.")
+    parser.add_argument('--transition_log',
+                        type=str,
+                        default=None,
+                        help="Directory of the log recording the raw transitions played by the AI agent, to replay them offline (see 'transition_log.py').")
                         
                         
 def add_sprites_args(parser):
@@ -153,6 +280,11 @@ def add_env_args(parser):
                         default=(90, 80),
                         nargs=2,
                         help="Distance between pipes (horizontal, vertical) in pixels.")
+    parser.add_argument('--collision',
+                        type=str,
+                        default="geometry",
+                        choices=("geometry", "raster"),
+                        help="Collision detection: analytic on the bird square ('geometry') or pixel-exact on the bird sprite with an occupancy grid ('raster').")
         # bird
     parser.add_argument('--bird_dims',
                         type=int,
@@ -0,0 +1,240 @@
+"""Define the class used to simulate many independent games at once.
+
+Authors:
+    Gael Colas
+"""
+
+import numpy as np
+
+from util import make_rng, BATCH_STREAM, AGENT_STREAM
+from args import get_game_args
+from bird import get_displacements, move_birds
+
+
+def is_collision(y, x, rows, cols, pipes_x, pipes_h, args):
+    """Check analytically if rectangles intersect with some environment obstacles.
+    Vectorized version of 'Environment.is_collision': all the inputs are broadcast together.
+
+    Args:
+        'y' (np.array of int): row coordinates of the top of the rectangles in the window
+        'x' (np.array of int): column coordinates of the left of the rectangles in the window
+        'rows' (int): height of the rectangles
+        'cols' (int): width of the rectangles
+        'pipes_x' (np.array of int, shape=(..., n_pipes)): coord of front of the pipes of each rectangle's environment
+        'pipes_h' (np.array of int, shape=(..., n_pipes)): height of the bottom pipes of each rectangle's environment
+        'args' (ArgumentParser): parser gethering all the Game parameters
+
+    Return:
+        'isCollision' (np.array of bool): indicates which rectangles intersect with an obstacle
+    """
+    H, W = args.window_size
+    # y-coordinate of the top of the floor
+    y_floor = H - args.ground_height
+
+    y, x = np.asarray(y), np.asarray(x)
+
+    # the window borders and the floor
+    isCollision = (y < 0) | (x < 0) | (x + cols > W) | (y + rows > y_floor)
+
+    # the rectangles in front of the visible part of the pipes
+    y, x = y[..., np.newaxis], x[..., np.newaxis]
+    isFront = (pipes_x < W) & (np.maximum(pipes_x, 0) < x + cols) & (x < np.minimum(pipes_x + args.pipe_width, W))
+    # bottom pipes or top pipes
+    isPipe = (y + rows > y_floor - pipes_h) | (y < y_floor - pipes_h - args.pipe_dist[1])
+
+    return isCollision | np.any(isFront & isPipe, axis=-1)
+
+
+class BatchEnvironment:
+    """Class to simulate 'n_games' independent games with one vectorized step.
+
+    Attributes:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'n_games' (int): number of games simulated at once
+        'x' (int): row pixel coordinate of the Birds center (fixed)
+        'y' (np.array, shape=(n_games,), dtype=int): column pixel coordinate of each Bird center
+        't' (np.array, shape=(n_games,), dtype=int): number of time steps since the last jump of each Bird
+        'pipes_x' (np.array, shape=(n_games, n_pipes), dtype=int): coord of front of the pipes of each game
+        'pipes_h' (np.array, shape=(n_games, n_pipes), dtype=int): height of the bottom pipes of each game
+        'score' (np.array, shape=(n_games,), dtype=int): current score of each game
+        'done' (np.array, shape=(n_games,), dtype=bool): whether each game has been failed
+        'rng' (np.random.Generator): random stream of the pipe heights, derived from the master seed 'args.seed'
+
+    Remarks:
+        Reproduces the dynamics of 'Bird.move', 'Environment.generate_pipe' and 'Environment.scroll', and the rules of 'Simulator.update_score' and 'Simulator.fail' ('geometry' collision).
+        Nothing is rendered: only the states are simulated.
+        Failed games are not restarted automatically: call 'reset' with the mask of the games to restart.
+    """
+
+    def __init__(self, args, n_games):
+        super(BatchEnvironment).__init__()
+
+        # load the Game parameters
+        self.args = args
+        self.n_games = n_games
+        self.rng = make_rng(self.args.seed, BATCH_STREAM)
+        # shared table of the displacements of the Birds
+        self.displacements = get_displacements(self.args)
+
+        # number of pipes in each game
+        self.n_pipes = self.args.window_size[1]//(self.args.pipe_width + self.args.pipe_dist[1]) + 2
+        # horizontal distance between the fronts of 2 successive pipes
+        self.pipe_step = self.args.pipe_dist[0] + self.args.pipe_width
+
+        # state of the games
+        self.x = self.args.bird_pos[0]
+        self.y = np.zeros(n_games, dtype=int)
+        self.t = np.zeros(n_games, dtype=int)
+        self.pipes_x = np.zeros((n_games, self.n_pipes), dtype=int)
+        self.pipes_h = np.zeros((n_games, self.n_pipes), dtype=int)
+        self.score = np.zeros(n_games, dtype=int)
+        self.done = np.zeros(n_games, dtype=bool)
+
+        # start all the games
+        self.reset()
+
+    def reset(self, mask=None):
+        """Reset the environments and the birds positions to start new games.
+
+        Args:
+            'mask' (np.array, shape=(n_games,), dtype=bool, default=None): games to reset (all the games if None)
+
+        Return:
+            'states' (np.array, shape=(n_games, 4)): the current states of all the Birds
+        """
+        if mask is None:
+            mask = np.ones(self.n_games, dtype=bool)
+        n_reset = np.count_nonzero(mask)
+
+        # initial Birds
+        self.y[mask] = self.args.bird_pos[1]
+        self.t[mask] = int(self.args.v0 / self.args.a0)
+
+        # the first pipe is placed after the right border of the window, the next ones at 'pipe_dist[0]' distance
+        self.pipes_x[mask] = self.args.window_size[1] + self.pipe_step*np.arange(self.n_pipes)
+        self.pipes_h[mask] = self.generate_heights((n_reset, self.n_pipes))
+
+        self.score[mask] = 0
+        self.done[mask] = False
+
+        return self.get_states()
+
+    def generate_heights(self, size):
+        """Generate random heights for new pipes.
+
+        Args:
+            'size' (int or tuple of int): number of heights to generate
+
+        Return:
+            'heights' (np.array of int): heights of the bottom pipes
+        """
+        return self.rng.integers(self.args.pipe_min_height, self.args.window_size[0]-self.args.ground_height-self.args.pipe_dist[1]-self.args.pipe_min_height, size=size)
+
+    def get_states(self):
+        """Return the states of the Birds: [y, dx, dy, t] as defined in 'Environment.get_state'.
+
+        Return:
+            'states' (np.array, shape=(n_games, 4)): the current states of all the Birds
+        """
+        # index of the next pipe: the first pipe the bird has not crossed
+        next_idx = np.argmax(self.pipes_x + self.args.pipe_width >= self.x - self.args.bird_dims[1], axis=1)
+        next_x = self.pipes_x[np.arange(self.n_games), next_idx]
+        next_h = self.pipes_h[np.arange(self.n_games), next_idx]
+
+        # coordinates of the center of the next pipe's opening
+        x_c = next_x + self.args.pipe_width
+        y_c = -next_h + self.args.window_size[0] - self.args.ground_height - self.args.pipe_dist[1]//2
+
+        return np.stack([self.y, x_c - self.x, y_c - self.y, self.t], axis=1)
+
+    def update_score(self):
+        """Update the scores of the games where the middle of a pipe is crossed.
+
+        Return:
+            'isCrossed' (np.array, shape=(n_games,), dtype=bool): indicate that the middle of the next pipe has been crossed
+        """
+        isCrossed = np.any(self.pipes_x + self.args.pipe_width//2 == self.x, axis=1)
+        self.score += isCrossed
+
+        return isCrossed
+
+    def fail(self):
+        """Check which games are failed.
+
+        Return:
+            'isCollision' (np.array, shape=(n_games,), dtype=bool): indicates which Birds encountered an obstacle
+        """
+        rows, cols = self.args.bird_dims
+        pad = self.args.padding
+        # find the top-left coordinates of the birds images in the window
+        x_b, y_b = self.x - cols//2, np.maximum(self.y + pad - rows//2, 0) - pad
+
+        return is_collision(y_b, x_b, rows, cols, self.pipes_x, self.pipes_h, self.args)
+
+    def move(self, actions):
+        """Update the states of the Birds after 1 time step move.
+
+        Args:
+            'actions' (np.array, shape=(n_games,)): actions performed by each Bird (1 if jumping, 0 otherwise)
+        """
+        self.y = move_birds(self.y, self.t, actions, self.displacements)
+
+    def scroll(self):
+        """Scroll all the environments of 1 pixel to the left.
+        """
+        # move the pipes 1 pixel to the left
+        self.pipes_x -= 1
+
+        # remove the pipes that completely left the screen and add new pipes at the end
+        isLeft = self.pipes_x[:, 0] + self.args.pipe_width < 0
+        n_left = np.count_nonzero(isLeft)
+        if n_left > 0:
+            self.pipes_x[isLeft, :-1] = self.pipes_x[isLeft, 1:]
+            self.pipes_h[isLeft, :-1] = self.pipes_h[isLeft, 1:]
+            self.pipes_x[isLeft, -1] = self.pipes_x[isLeft, -2] + self.pipe_step
+            self.pipes_h[isLeft, -1] = self.generate_heights(n_left)
+
+    def step(self, actions):
+        """Play one time step in all the games.
+
+        Args:
+            'actions' (np.array, shape=(n_games,)): actions performed by each Bird (1 if jumping, 0 otherwise)
+
+        Return:
+            'new_states' (np.array, shape=(n_games, 4)): the new states of the Birds
+            'isScoreUpdated' (np.array, shape=(n_games,), dtype=bool): whether a point has been earned in each game
+            'isFail' (np.array, shape=(n_games,), dtype=bool): whether each game has been failed
+        """
+        # update the scores
+        isScoreUpdated = self.update_score()
+
+        # the players that hit an obstacle
+        isFail = self.fail()
+        self.done |= isFail
+
+        # compute the new birds positions
+        self.move(np.asarray(actions))
+
+        # scroll 1 frame
+        self.scroll()
+
+        return self.get_states(), isScoreUpdated, isFail
+
+
+if __name__ == '__main__':
+    """Measure the simulation throughput of random policies."""
+    import time
+
+    # get arguments needed to play the Game
+    args = get_game_args()
+    batch_env = BatchEnvironment(args, n_games=1000)
+    # random actions: stream derived from the master seed
+    rng = make_rng(args.seed, AGENT_STREAM)
+
+    T = 1000
+    start = time.time()
+    for t in range(T):
+        batch_env.step(rng.random(batch_env.n_games) < 0.05)
+        batch_env.reset(batch_env.done)
+    elapsed = time.time() - start
+    print("{:.0f} game steps/s".format(T*batch_env.n_games / elapsed))
@@ -0,0 +1,231 @@
+"""Benchmark of the hot paths of the simulation and of the AI agent.
+
+Run it with: `python -m benchmark --output bench.json [--baseline bench_baseline.json]`
+The baseline is the output of a previous run on the same machine (e.g. on the main branch): latencies are not comparable across machines.
+
+Authors:
+    Gael Colas
+"""
+
+import argparse
+import ujson as json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from args import get_game_args
+from simulator import Simulator
+from agent import AIAgent
+
+
+def get_benchmark_args():
+    """Get arguments needed to run the benchmark."""
+    parser = argparse.ArgumentParser('Benchmark the hot paths of the Game and of the AI agent.')
+
+    parser.add_argument('--window_sizes',
+                        type=str,
+                        default=("370x240", "740x480"),
+                        nargs='+',
+                        help="Window dimensions HxW of the benchmarked configurations.")
+    parser.add_argument('--n_states',
+                        type=str,
+                        default=("10x5x10", "15x5x15"),
+                        nargs='+',
+                        help="State discretizations n_yxn_dxxn_dy of the benchmarked configurations.")
+    parser.add_argument('--n_calls',
+                        type=int,
+                        default=2000,
+                        help="Number of timed calls of each function.")
+    parser.add_argument('--n_solves',
+                        type=int,
+                        default=5,
+                        help="Number of timed solves of the MDP (much slower than the other functions).")
+    parser.add_argument('--solvers',
+                        type=str,
+                        default=("value_iteration", "gauss_seidel", "policy_iteration", "linear"),
+                        nargs='+',
+                        help="Solvers of the MDP to compare (see 'AIAgent.solve_mdp').")
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help="Master seed of the simulations.")
+    parser.add_argument('--output',
+                        type=str,
+                        default=None,
+                        help="JSON file where the results are written (printed if None).")
+    parser.add_argument('--baseline',
+                        type=str,
+                        default=None,
+                        help="JSON file of previous results to compare with.")
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=1.25,
+                        help="A function is flagged as a regression if its median latency is 'threshold' times the baseline one.")
+
+    return parser.parse_args()
+
+
+def time_calls(fn, n_calls, setup=None):
+    """Time the calls of a function.
+
+    Args:
+        'fn' (function): function to time, called without argument
+        'n_calls' (int): number of timed calls
+        'setup' (function, default=None): function called before each call, not timed
+
+    Return:
+        'stats' (dict): calls per second, latency percentiles (in microseconds) and peak memory allocated by the calls (in bytes)
+    """
+    latencies = np.zeros(n_calls)
+    for k in range(n_calls):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        latencies[k] = time.perf_counter() - start
+
+    # memory is measured apart: tracing the allocations slows the calls down
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        'calls_per_sec': n_calls / latencies.sum(),
+        'mean_us': latencies.mean() * 1e6,
+        'p50_us': p50,
+        'p90_us': p90,
+        'p99_us': p99,
+        'peak_memory_bytes': peak_memory
+    }
+
+def play(sim, agent, n_steps):
+    """Let the agent play 'n_steps' time steps in the simulation (new games are started after each failure).
+
+    Return:
+        'n_games' (int): number of finished games
+    """
+    n_games = 0
+    for t in range(n_steps):
+        action = agent.choose_action()
+        new_state, isScoreUpdated, isFail = sim.step(action)
+        agent.set_transition(new_state, isScoreUpdated, isFail)
+        if isFail:
+            agent.reset(sim.reset())
+            n_games += 1
+
+    return n_games
+
+def benchmark_config(args, n_calls, n_solves, solvers):
+    """Benchmark the hot paths in one configuration of the Game.
+
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'n_calls' (int): number of timed calls of each function
+        'n_solves' (int): number of timed solves of the MDP
+        'solvers' (list of str): solvers of the MDP to time
+
+    Return:
+        'results' (dict, {name: stats}): statistics of each benchmarked function (see 'time_calls')
+    """
+    results = {}
+
+    # simulation with the rendering of the frames
+    sim = Simulator(args, render=True)
+    results['Environment.scroll'] = time_calls(sim.env.scroll, n_calls)
+    results['Environment.build_env'] = time_calls(sim.env.build_env, n_calls)
+    results['Simulator.fail'] = time_calls(sim.fail, n_calls)
+    results['Simulator.update_score'] = time_calls(sim.update_score, n_calls)
+    results['Bird.move'] = time_calls(sim.bird.move, n_calls, setup=sim.bird.jump)
+
+    # AI agent, trained on a few games to fill the MDP
+    sim = Simulator(args)
+    agent = AIAgent(args, sim.env.get_state())
+    play(sim, agent, n_calls)
+    state = sim.env.get_state()
+    results['AIAgent.get_closest_state_idx'] = time_calls(lambda: agent.get_closest_state_idx(state), n_calls)
+    results['AIAgent.best_action'] = time_calls(lambda: agent.best_action(state), n_calls)
+
+    # solve of the MDP from scratch, with each solver
+    def reset_value():
+        agent.mdp_data['value'] = np.zeros(agent.mdp_data['num_states'])
+    for solver in solvers:
+        args.solver = solver
+        name = 'AIAgent.update_mdp_parameters[{}]'.format(solver)
+        results[name] = time_calls(agent.update_mdp_parameters, n_solves, setup=reset_value)
+        results[name]['n_iter'] = agent.n_iter
+
+    # headless training: full time steps of the agent in the simulation
+    start = time.perf_counter()
+    play(sim, agent, n_calls)
+    results['train.step'] = {'steps_per_sec': n_calls / (time.perf_counter() - start)}
+
+    return results
+
+def compare(results, baseline, threshold):
+    """Compare the median latencies and the throughputs with the ones of a baseline.
+
+    Args:
+        'results' (dict): results of the benchmark
+        'baseline' (dict): results of a previous benchmark
+        'threshold' (float): minimum slowdown ratio to flag a regression
+
+    Return:
+        'regressions' (list of str): description of the regressions
+    """
+    regressions = []
+    for config, stats in results['configs'].items():
+        for name, stat in stats.items():
+            base_stat = baseline['configs'].get(config, {}).get(name, {})
+            if 'p50_us' in stat and 'p50_us' in base_stat:
+                ratio = stat['p50_us'] / base_stat['p50_us']
+                stat['baseline_ratio'] = ratio
+                if ratio >= threshold:
+                    regressions.append("{} [{}]: p50 {:.1f}us vs {:.1f}us (x{:.2f})".format(name, config, stat['p50_us'], base_stat['p50_us'], ratio))
+            # throughputs: the higher the better
+            elif 'steps_per_sec' in stat and 'steps_per_sec' in base_stat:
+                ratio = base_stat['steps_per_sec'] / stat['steps_per_sec']
+                stat['baseline_ratio'] = ratio
+                if ratio >= threshold:
+                    regressions.append("{} [{}]: {:.0f} steps/s vs {:.0f} steps/s (x{:.2f})".format(name, config, stat['steps_per_sec'], base_stat['steps_per_sec'], ratio))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    bench_args = get_benchmark_args()
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'n_calls': bench_args.n_calls,
+        'configs': {}
+    }
+    for window_size in bench_args.window_sizes:
+        for n_states in bench_args.n_states:
+            config = "window_size={} n_states={}".format(window_size, n_states)
+            argv = ['--agent', 'ai', '--seed', str(bench_args.seed), '--window_size'] + window_size.split('x') + ['--state_axes', 'y', 'dx', 'dy', '--n_states'] + n_states.split('x')
+            results['configs'][config] = benchmark_config(get_game_args(argv), bench_args.n_calls, bench_args.n_solves, bench_args.solvers)
+            print("{}: {:.0f} steps/s".format(config, results['configs'][config]['train.step']['steps_per_sec']), file=sys.stderr)
+
+    regressions = []
+    if bench_args.baseline is not None:
+        with open(bench_args.baseline, "r") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), bench_args.threshold)
+        results['regressions'] = regressions
+
+    if bench_args.output is not None:
+        with open(bench_args.output, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    for regression in regressions:
+        print("REGRESSION " + regression, file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -4,17 +4,81 @@ Authors:
     Gael Colas
 """
 
+from functools import lru_cache
+
 import numpy as np
 
 from util import *
 
 
+def saturation_time(args):
+    """Number of time steps after a jump from which the Bird falls at the maximum velocity 'v_max'.
+
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+
+    Return:
+        't_sat' (int): first time step 't' (after the boost) such that t*v0 - 0.5*t**2*a0 <= -v_max
+    """
+    return len(get_displacements(args)) - 1
+
+def get_displacements(args):
+    """Get the table of the vertical displacements of a Bird after a jump.
+    The table is computed once and shared by all the Birds with the same dynamics.
+    
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+    
+    Return:
+        'displacements' (np.array, shape=(t_sat+1,)): read-only upward displacement (in pixels) at each time step 't' since the jump
+                displacements[min(t, t_sat)] = max(t*v0 - 0.5*t**2*a0 + (t < 5)*dy, -v_max)
+    """
+    return _get_displacements(args.v0, args.a0, args.dy, args.v_max)
+
+@lru_cache(maxsize=None)
+def _get_displacements(v0, a0, dy, v_max):
+    """Cached implementation of 'get_displacements'."""
+    # first time step (after the boost) such that t*v0 - 0.5*t**2*a0 <= -v_max
+    t_sat = (v0 + np.sqrt(v0**2 + 2*a0*v_max)) / a0
+    t = np.arange(max(int(np.ceil(t_sat)), 5) + 1)
+    # same expression as the original scalar update: identical rounding
+    displacements = np.maximum(t*v0 -0.5*t**2*a0 + (t < 5)*dy, -v_max)
+    displacements.setflags(write=False)
+    
+    return displacements
+
+def move_birds(y, t, actions, displacements):
+    """Update the states of a batch of Birds after 1 time step move.
+    Vectorized version of 'Bird.jump' and 'Bird.move'.
+    
+    Args:
+        'y' (np.array of int): column pixel coordinate of each Bird center
+        't' (np.array of int): number of time steps since the last jump of each Bird, updated in place
+        'actions' (np.array of int): actions performed by each Bird (1 if jumping, 0 otherwise)
+        'displacements' (np.array): table of the vertical displacements (see 'get_displacements')
+    
+    Return:
+        'y' (np.array of int): new column pixel coordinate of each Bird center
+    """
+    # jumping Birds
+    t[actions == 1] = 0
+    # update the number of times steps since the last jump
+    t += 1
+    
+    # new y-coordinate of the birds after the move
+    dy = displacements[np.minimum(t, len(displacements) - 1)]
+    
+    return np.maximum(np.trunc(y - dy).astype(int), 0)
+
+
 class Bird:
     """Hero of the game.
     
     Attributes:
         'args' (ArgumentParser): parser gethering all the Game parameters
         'img' (np.array, shape=bird_dims): RGB-pixel array of the Bird sprite, resized to the standard shape 'bird_dims'
+        'mask' (np.array, shape=bird_dims, dtype=bool): green-screen mask of 'img' (see 'green_screen')
+        'pixel_mask' (np.array, shape=(bird_dims, 3), dtype=bool): 'mask' repeated on the RGB channels, to paint the Bird with 'np.copyto'
         'x' (int): row pixel coordinate of the Bird center in the environment
         'y' (int): column pixel coordinate of the Bird center in the environment
         't' (int): number of time steps since the last jump
@@ -28,11 +92,23 @@ class Bird:
         super(Bird).__init__()
         self.args = args
 
-        self.img = jpg2numpy(self.args.bird_sprite, self.args.bird_dims)
+        self.set_sprite(self.args.bird_sprite, self.args.bird_dims)
         self.x = self.args.bird_pos[0]
         self.y = self.args.bird_pos[1]
         
         self.t = int(self.args.v0 / self.args.a0)
+        # shared table of the displacements
+        self.displacements = get_displacements(self.args)
+    
+    def set_sprite(self, sprite, dims):
+        """Change the image of the bird.
+        
+        Args:
+            'sprite' (str): filename of the sprite
+            'dims' (tuple of int): dimensions of the image
+        """
+        self.img, self.mask = load_sprite(sprite, dims)
+        self.pixel_mask = np.ascontiguousarray(np.broadcast_to(self.mask[:, :, np.newaxis], self.img.shape))
     
     def jump(self):
         """Update the state of the bird to account for a new jump.
@@ -47,6 +123,6 @@ class Bird:
         self.t += 1
         
         # new y-coordinate of the bird after the move
-        self.y -= max(self.t*self.args.v0 -0.5*self.t**2*self.args.a0 + (self.t < 5)*self.args.dy, -self.args.v_max)
+        self.y -= self.displacements[min(self.t, len(self.displacements) - 1)]
         # convert to int
         self.y = max(int(self.y), 0)
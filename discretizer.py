@@ -0,0 +1,87 @@
+"""Discretization of the continuous state of the Bird.
+
+Authors:
+    Gael Colas
+"""
+
+import math
+
+import numpy as np
+
+
+# components of the continuous state returned by 'Environment.get_state'
+STATE_AXES = ("y", "dx", "dy", "t")
+
+
+class Discretizer:
+    """Map continuous states to the indices of the closest points of uniform grids, one grid per axis of the state.
+
+    Attributes:
+        'grids' (list of np.array): uniform grid of discretized values of each axis
+        'low' (np.array, shape=(n_axes,)): first value of each grid
+        'step' (np.array, shape=(n_axes,)): spacing of each grid
+        'n_points' (np.array, shape=(n_axes,), dtype=int): number of points of each grid
+        'axes' (np.array, shape=(n_axes,), dtype=int): position in the continuous state of the component discretized by each grid
+        'num_states' (int): number of discretized states, including the FAIL state
+                num_states = prod(n_points) + 1
+
+    Remarks:
+        The grids are uniform: the index of the closest point is a rounded affine transform of the value, no search is needed.
+    """
+
+    def __init__(self, grids, axes=None):
+        super(Discretizer).__init__()
+
+        self.axes = np.arange(len(grids)) if axes is None else np.asarray(axes, dtype=int)
+        self.grids = [np.asarray(grid, dtype=float) for grid in grids]
+        self.low = np.array([grid[0] for grid in self.grids])
+        self.n_points = np.array([len(grid) for grid in self.grids])
+        self.step = np.array([(grid[-1] - grid[0]) / (len(grid) - 1) if len(grid) > 1 else 1. for grid in self.grids])
+        self.num_states = int(np.prod(self.n_points)) + 1
+
+        # plain Python parameters of the single-state path: numpy calls on tiny arrays cost more than the arithmetic
+        self._params = [(int(axis), float(low), float(step), int(n)) for axis, low, step, n in zip(self.axes, self.low, self.step, self.n_points)]
+
+    def get_indices(self, states):
+        """Get the indices of the closest discretized values on each axis.
+
+        Args:
+            'states' (np.array, shape=(n_axes,) or (n, n_axes)): one state or a batch of states
+
+        Return:
+            'indices' (np.array, shape=(n_axes,) or (n, n_axes), dtype=int): index of the closest point on each axis
+                    same as np.argmin(abs(grid - value)) for each axis
+
+        Remarks:
+            A value exactly in the middle of 2 points is mapped to the first one, as np.argmin does.
+        """
+        indices = np.ceil((np.asarray(states, dtype=float) - self.low) / self.step - 0.5).astype(int)
+
+        return np.clip(indices, 0, self.n_points - 1)
+
+    def get_state_idx(self, states, isFail=False):
+        """Get the flat index of the closest discretized state.
+
+        Args:
+            'states' (np.array, shape=(n_state,) or (n, n_state)): one continuous state or a batch of continuous states
+            'isFail' (bool or np.array of bool, default=False): whether each Game is failed
+
+        Return:
+            'ind' (int or np.array of int): index of the closest discretized state
+
+        Remarks:
+            State 0 is a FAIL state: the grid points are indexed from 1, in row-major order of the axes.
+        """
+        # single state: scalar arithmetic, same rounding as 'get_indices'
+        if np.ndim(states) == 1:
+            if isFail:
+                return 0
+            ind = 0
+            for axis, low, step, n in self._params:
+                ind = ind*n + min(max(math.ceil((float(states[axis]) - low) / step - 0.5), 0), n - 1)
+            return ind + 1
+
+        indices = self.get_indices(np.asarray(states)[..., self.axes])
+        ind = np.ravel_multi_index(tuple(np.moveaxis(indices, -1, 0)), self.n_points) + 1
+
+        return np.logical_not(isFail)*ind
@@ -4,6 +4,8 @@ Authors:
     Gael Colas
 """
 
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
@@ -12,6 +14,86 @@ from util import *
 from args import get_game_args
 
 
+class PipeSchedule:
+    """Random heights of the successive pipes of a game, drawn by blocks.
+    
+    Attributes:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'rng' (np.random.Generator): random stream of the heights
+        'block_size' (int): number of heights drawn at once
+        'heights' (list of int): heights of the next pipes
+        'idx' (int): index in 'heights' of the next pipe
+    
+    Remarks:
+        The heights only depend on 'rng': the pipes of a game are the same whatever the agent does.
+    """
+    
+    def __init__(self, args, rng, block_size=64):
+        super(PipeSchedule).__init__()
+        self.args = args
+        self.rng = rng
+        self.block_size = block_size
+        self.heights = np.zeros(0, dtype=int)
+        self.idx = 0
+    
+    def next(self):
+        """Return the height of the next pipe."""
+        if self.idx == len(self.heights):
+            # one vectorized draw for the next 'block_size' pipes
+            self.heights = self.rng.integers(self.args.pipe_min_height, self.args.window_size[0]-self.args.ground_height-self.args.pipe_dist[1]-self.args.pipe_min_height, size=self.block_size).tolist()
+            self.idx = 0
+        
+        self.idx += 1
+        
+        return self.heights[self.idx - 1]
+    
+
+@lru_cache(maxsize=None)
+def load_pipe_imgs(pipe_sprite, pipe_dims):
+    """Load the pipe sprite facing up and its rotated version facing down.
+    The images are loaded once and shared by all the Environments.
+    
+    Args:
+        'pipe_sprite' (str): sprite filename for the pipes
+        'pipe_dims' (tuple of int, (rows, cols)): dimensions of the full pipe image
+    
+    Return:
+        'pipe_img' (np.array, shape=(pipe_dims,3)): RGB-pixel array representing a pipe facing up
+        'pipe_img_rot' (np.array, shape=(pipe_dims,3)): RGB-pixel array representing a pipe facing down
+    """
+    pipe_img, _ = load_sprite(pipe_sprite, pipe_dims)
+    
+    # rotated version of the pipe sprite
+    rows, cols = pipe_img.shape[0:2]
+    pipe_img_rot = cv2.warpAffine(pipe_img, cv2.getRotationMatrix2D((cols/2,rows/2),180,1), (cols,rows))
+    
+    # shared array: prevent in-place modifications
+    pipe_img_rot.setflags(write=False)
+    
+    return pipe_img, pipe_img_rot
+    
+@lru_cache(maxsize=1024)
+def resize_pipe_img(pipe_sprite, pipe_dims, height, isTop=False):
+    """Resize the pipe image to the given height.
+    The resized images are cached and shared by all the Environments: a pipe height never changes and heights come from a small range.
+    
+    Args:
+        'pipe_sprite' (str): sprite filename for the pipes
+        'pipe_dims' (tuple of int, (rows, cols)): dimensions of the full pipe image
+        'height' (int): number of rows of the resized image
+        'isTop' (bool, default=False): whether to resize the pipe facing down (top pipe) or the pipe facing up (bottom pipe)
+    
+    Return:
+        'resized_pipe_img' (np.array, shape=(height, pipe_dims[1], 3)): RGB-pixel array representing the resized pipe
+    """
+    pipe_img, pipe_img_rot = load_pipe_imgs(pipe_sprite, pipe_dims)
+    
+    resized_pipe_img = cv2.resize(pipe_img_rot if isTop else pipe_img, dsize=(pipe_dims[1], height), interpolation=cv2.INTER_CUBIC)
+    resized_pipe_img.setflags(write=False)
+    
+    return resized_pipe_img
+    
+
 class Environment:
     """Class to update and generate the game environment.
     
@@ -19,22 +101,33 @@ class Environment:
         'args' (ArgumentParser): parser gethering all the Game parameters
         'isHuman' (bool, default=True): whether a human or an AI is playing the Game
         'bird' (Bird, default=None): the Bird
+        'render' (bool, default=True): whether to build the RGB-pixel array 'map' (not needed to simulate the Game)
         'bg_img' (np.array, shape=(window_size[0]-ground_height, window_size[1])): RGB-pixel array representing the background image
         'floor_img'(np.array, shape=(ground_height, window_size[1])): RGB-pixel array representing the floor image
         'pipe_img' (np.array, shape=(window_size[0], pipe_width)): RGB-pixel array representing a pipe facing up
         'pipe_img_rot' (np.array, shape=(window_size[0], pipe_width)): RGB-pixel array representing a pipe facing down
+        'pipe_dims' (tuple of int, (window_size[0], pipe_width)): dimensions of the full pipe images
+        'pipe_schedule' (PipeSchedule, default=None): random heights of the successive pipes (drawn from an unseeded stream if None)
         'pipes' (list of tuple, (x, height)): list of all the current pipes in the environment 
                     (x = coord of front of pipe ; height = height of bottom pipe)
-        'map' (np.array, shape=window_size, dtype=int): RGB-pixel array representing the full environment
-        'occ' (np.array, shape=window_size, dtype=int): occupancy grid = binary matrix indicating the presence of obstacles
-                    occ[i,j] = 1 if pixel (i,j) represents an obstacle, 0 otherwise
+        'bg_map' (np.array, shape=window_size, dtype=uint8): RGB-pixel array representing the static background (background and floor)
+        'map' (np.array, shape=window_size, dtype=uint8): RGB-pixel array representing the full environment (C-contiguous)
+        'bird_rect' (tuple of int, (y, x, rows, cols)): area of 'map' where the Bird is currently painted
+        'bird_bg' (np.array, shape=(rows, cols, 3), dtype=uint8): pixels of 'map' under the Bird (background and pipes)
+        'rasterize' (bool): whether to build the occupancy grid 'occ' (only needed for the 'raster' collision detection)
+        'occ' (np.array, shape=window_size, dtype=bool): occupancy grid = binary matrix indicating the presence of obstacles
+                    occ[i,j] = True if pixel (i,j) represents an obstacle, False otherwise
+                    None if 'rasterize' is False
     
     Remarks:
         The object images are resized to the expected size as specified in 'args'.
+        The pipe images are shared by all the Environments (see 'load_pipe_imgs' and 'resize_pipe_img').
         A new pipe is generated when the front one leave the screen. The height of the new pipe is randomly generated.
+        The buffers 'map' and 'occ' are persistent: scrolling only repaints the pixels that changed, and a full rebuild reuses them.
+        '*_win' attributes are views on the window area (without the padding) of the corresponding buffers.
     """
 
-    def __init__(self, args, bird=None):
+    def __init__(self, args, bird=None, render=True, pipe_schedule=None):
         super(Environment).__init__()
         
         # load the Game parameters
@@ -43,18 +136,38 @@ class Environment:
         self.isHuman = (args.agent == "human")
         # save the current Bird
         self.bird = bird
+        # headless simulations do not need the RGB-pixel array
+        self.render = render
+        # the analytic collision detection does not need the occupancy grid
+        self.rasterize = (self.args.collision == "raster")
+        # heights of the pipes
+        self.pipe_schedule = pipe_schedule if pipe_schedule is not None else PipeSchedule(args, np.random.default_rng())
         
         # window padding
         self.pad = self.args.padding
         
         # load and reshape all the environment objects' sprites
-        self.bg_img = jpg2numpy(self.args.bg_sprite, (self.args.window_size[0]-self.args.ground_height, self.args.window_size[1]))
-        self.floor_img = jpg2numpy(self.args.floor_sprite, (self.args.ground_height, self.args.window_size[1]))
-        self.pipe_img = jpg2numpy(self.args.pipe_sprite, (self.args.window_size[0], self.args.pipe_width))
+        self.bg_img, _ = load_sprite(self.args.bg_sprite, (self.args.window_size[0]-self.args.ground_height, self.args.window_size[1]))
+        self.floor_img, _ = load_sprite(self.args.floor_sprite, (self.args.ground_height, self.args.window_size[1]))
+        # pipe sprite and its rotated version
+        self.pipe_dims = (self.args.window_size[0], self.args.pipe_width)
+        self.pipe_img, self.pipe_img_rot = load_pipe_imgs(self.args.pipe_sprite, self.pipe_dims)
+        
+        if self.render:
+            # static background: background and floor images padded in black
+            self.bg_map = np.zeros((self.args.window_size[0] + 2*self.pad, self.args.window_size[1] + 2*self.pad, 3), dtype=np.uint8)
+            self.bg_win = self.bg_map[self.pad: self.pad + self.args.window_size[0], self.pad: self.pad + self.args.window_size[1]]
+            self.bg_win[:self.args.window_size[0]-self.args.ground_height] = self.bg_img
+            self.bg_win[self.args.window_size[0]-self.args.ground_height:] = self.floor_img
+            # persistent buffer of the full environment
+            self.map = np.empty_like(self.bg_map)
+            self.map_win = self.map[self.pad: self.pad + self.args.window_size[0], self.pad: self.pad + self.args.window_size[1]]
         
-        # rotated version of the pipe sprite
-        rows, cols = self.pipe_img.shape[0:2]
-        self.pipe_img_rot = cv2.warpAffine(self.pipe_img, cv2.getRotationMatrix2D((cols/2,rows/2),180,1), (cols,rows))
+        # persistent occupancy grid
+        self.occ = None
+        if self.rasterize:
+            self.occ = np.empty((self.args.window_size[0] + 2*self.pad, self.args.window_size[1] + 2*self.pad), dtype=bool)
+            self.occ_win = self.occ[self.pad: self.pad + self.args.window_size[0], self.pad: self.pad + self.args.window_size[1]]
         
         # generate 'n_pipes' successive pipes
         self.pipes = []
@@ -68,67 +181,190 @@ class Environment:
     def build_env(self):
         """
         Build and store the RGB-pixel array 'map' corresponding to the full environment: place the objects (bird and pipes) at the right place in the background image.
-        Build and store the occupancy grid 'occ' indicating the presence of obstacles: occ[i,j] = 1 if pixel (i,j) represents an obstacle, 0 otherwise.
+        Build and store the occupancy grid 'occ' indicating the presence of obstacles: occ[i,j] = True if pixel (i,j) represents an obstacle, False otherwise.
+        
+        Remarks:
+            The RGB-pixel array 'map' is only built if 'render' is True.
+            The occupancy grid 'occ' is only built if 'rasterize' is True.
+            This is a full rebuild: when scrolling, the buffers are updated incrementally by 'update_env' instead.
         """
-        # initialize the environment pixel matrix and the occupancy grid
-        map = np.zeros((self.args.window_size[0], self.args.window_size[1], 3), dtype=int)
-        occ = np.zeros(map.shape[0:2], dtype=int)
-
-        # add the background image
-        map[:self.args.window_size[0]-self.args.ground_height, :, :] = self.bg_img
-        # add the floor image
-        map[self.args.window_size[0]-self.args.ground_height:, :, :] = self.floor_img
-        # the floor is an obstacle
-        occ[self.args.window_size[0]-self.args.ground_height:, :] = 1
+        if self.rasterize:
+            # pad with obstacles the border of the environment
+            self.occ[:] = True
+            # window area of the occupancy grid: the floor is an obstacle
+            self.occ_win[:self.args.window_size[0]-self.args.ground_height, :] = False
+        
+        if self.render:
+            # start from the background and the floor padded in black
+            np.copyto(self.map, self.bg_map)
         
         # add all the current pipes in the window
         for pipe in self.pipes:
-            x, height = pipe
+            # check that the pipe is inside the window
+            if (pipe[0] < self.args.window_size[1]):
+                # the pipe is an obstacle
+                self.set_pipe_occ(pipe, (max(pipe[0], 0), min(pipe[0] + self.args.pipe_width, self.args.window_size[1])))
+                # add the pipe
+                if self.render:
+                    self.paint_pipe(pipe)
+            else:
+                break
+        
+        if self.render:
+            # add the bird on top of the pipes
+            self.bird_rect = None
+            self.paint_bird()
+    
+    def update_env(self):
+        """Update incrementally the buffers 'occ' and 'map' after the pipes moved 1 pixel to the left.
+        
+        Remarks:
+            The background is static: only the pipes and the Bird area change.
+            The pipes are shifted by 1 column in the persistent buffer: only the columns they enter and leave are painted (see 'shift_pipe').
+        """
+        if self.render and self.bird_rect is not None:
+            # erase the previous Bird
+            y_b, x_b, rows, cols = self.bird_rect
+            self.map[y_b:y_b + rows, x_b:x_b + cols] = self.bird_bg
+        
+        for pipe in self.pipes:
+            x = pipe[0]
             
             # check that the pipe is inside the window
             if (x < self.args.window_size[1]):
-                # with of the pipe visible in the window
-                visible_width = min(x+self.args.pipe_width, self.args.window_size[1]) - x + min(0,x)
-                # x-coordinate of the visible front of the pipe
-                x = max(x,0)
-                # y-coordinate of the top of the bottom pipe
-                y = self.args.window_size[0]-self.args.ground_height
+                # column left by the pipe: back to the background
+                x_left = x + self.args.pipe_width
+                if 0 <= x_left < self.args.window_size[1]:
+                    self.set_pipe_occ(pipe, (x_left, x_left + 1), False)
                 
-                # resize the bottom pipe image to match the visible area
-                bottom_pipe_img = cv2.resize(self.pipe_img, dsize=(self.args.pipe_width, height), interpolation=cv2.INTER_CUBIC)
-                # add the bottom pipe
-                map[y - height:y, x:x + visible_width, :] = bottom_pipe_img[:, :visible_width] 
-                # the bottom pipe is an obstacle
-                occ[y - height:y, x:x + visible_width] = 1
-
-                # y-coordinate of the bottom of the top pipe
-                height_top = self.args.window_size[0] - self.args.ground_height - height - self.args.pipe_dist[1]
-                # resize the top pipe image to match the visible area
-                top_pipe_img = cv2.resize(self.pipe_img_rot, dsize=(self.args.pipe_width, height_top), interpolation=cv2.INTER_CUBIC)
-                # add the top pipe
-                map[:height_top, x:x + visible_width, :] = top_pipe_img[:, :visible_width] 
-                # the top pipe is an obstacle
-                occ[:height_top, x:x + visible_width] = 1
+                # column entered by the pipe: new obstacle
+                if 0 <= x:
+                    self.set_pipe_occ(pipe, (x, x + 1))
+                
+                if self.render:
+                    self.shift_pipe(pipe)
             else:
                 break
         
-        # pad in black the border of the environment
-        self.map = np.zeros((self.args.window_size[0] + 2*self.pad, self.args.window_size[1] + 2*self.pad, 3), dtype=int)
-        self.map[self.pad: self.pad + self.args.window_size[0], self.pad: self.pad + self.args.window_size[1], :] = map
-        
-        # add the bird
-        if self.bird is not None:
-            rows, cols, _ = self.bird.img.shape
-            # find the top-left coordinates of bird image
-            x_b, y_b = self.bird.x + self.pad - cols//2, max(self.bird.y + self.pad - rows//2, 0)
-            # green-screen filtering to display non-square bird shapes
-            display_mask = green_screen(self.bird.img)
-            # add the bird
-            self.map[y_b:y_b + rows, x_b:x_b + cols, :][display_mask] = self.bird.img[display_mask]
-        
-        # pad with obstacles the border of the environment
-        self.occ = np.ones((self.args.window_size[0] + 2*self.pad, self.args.window_size[1] + 2*self.pad), dtype=int)
-        self.occ[self.pad: self.pad + self.args.window_size[0], self.pad: self.pad + self.args.window_size[1]] = occ
+        if self.render:
+            # add the Bird at its new position
+            self.paint_bird()
+    
+    def set_pipe_occ(self, pipe, cols, value=True):
+        """Set the occupancy grid of some columns of a pipe (top and bottom parts).
+        
+        Args:
+            'pipe' (tuple, (x, height)): the pipe (x = coord of front of pipe ; height = height of bottom pipe)
+            'cols' (tuple of int, (x_start, x_end)): range of window columns to set
+            'value' (bool, default=True): True to add the pipe as an obstacle, False to remove it
+        """
+        if not self.rasterize:
+            return
+        
+        height = pipe[1]
+        # y-coordinate of the top of the bottom pipe
+        y = self.args.window_size[0] - self.args.ground_height
+        # y-coordinate of the bottom of the top pipe
+        height_top = y - height - self.args.pipe_dist[1]
+        
+        self.occ_win[y - height:y, cols[0]:cols[1]] = value
+        self.occ_win[:height_top, cols[0]:cols[1]] = value
+    
+    def get_pipe_imgs(self, height):
+        """Get the pipe images resized for a pipe of the given height.
+        
+        Args:
+            'height' (int): height of the bottom pipe
+        
+        Return:
+            'bottom_pipe_img' (np.array, shape=(height, pipe_width)): RGB-pixel array representing the bottom pipe
+            'top_pipe_img' (np.array, shape=(height_top, pipe_width)): RGB-pixel array representing the top pipe
+            
+        Remarks:
+            The resized images come from a cache shared by all the Environments: they must not be modified.
+        """
+        # y-coordinate of the bottom of the top pipe
+        height_top = self.args.window_size[0] - self.args.ground_height - height - self.args.pipe_dist[1]
+        
+        bottom_pipe_img = resize_pipe_img(self.args.pipe_sprite, self.pipe_dims, height)
+        top_pipe_img = resize_pipe_img(self.args.pipe_sprite, self.pipe_dims, height_top, isTop=True)
+        
+        return bottom_pipe_img, top_pipe_img
+    
+    def paint_pipe(self, pipe):
+        """Paint the visible part of a pipe (top and bottom parts) on the 'map'.
+        
+        Args:
+            'pipe' (tuple, (x, height)): the pipe (x = coord of front of pipe ; height = height of bottom pipe)
+        """
+        x, height = pipe
+        # with of the pipe visible in the window
+        visible_width = min(x+self.args.pipe_width, self.args.window_size[1]) - x + min(0,x)
+        if visible_width <= 0:
+            return
+        # x-coordinate of the visible front of the pipe
+        x = max(x,0)
+        # y-coordinate of the top of the bottom pipe
+        y = self.args.window_size[0]-self.args.ground_height
+        
+        bottom_pipe_img, top_pipe_img = self.get_pipe_imgs(height)
+        # add the bottom pipe
+        self.map_win[y - height:y, x:x + visible_width, :] = bottom_pipe_img[:, :visible_width] 
+        # add the top pipe
+        self.map_win[:top_pipe_img.shape[0], x:x + visible_width, :] = top_pipe_img[:, :visible_width] 
+    
+    def shift_pipe(self, pipe):
+        """Move the painted pipe (top and bottom parts) 1 pixel to the left on the 'map' (the Bird being erased).
+        
+        Args:
+            'pipe' (tuple, (x, height)): the pipe after the move (x = coord of front of pipe ; height = height of bottom pipe)
+        
+        Remarks:
+            The columns of the pipe that were already visible are shifted in place.
+            Only the column exposed at the right border of the window is painted from the pipe images, and the column left by the pipe is restored from the background.
+        """
+        x, height = pipe
+        W = self.args.window_size[1]
+        # y-coordinate of the top of the bottom pipe
+        y = self.args.window_size[0] - self.args.ground_height
+        # y-coordinate of the bottom of the top pipe
+        height_top = y - height - self.args.pipe_dist[1]
+        
+        # visible columns of the pipe: all of them come from the column on their right, but the last column of the window
+        x_start, x_end = max(x, 0), min(x + self.args.pipe_width, W)
+        # a pipe leaving the window is painted from its front (see 'paint_pipe'): only its column left changes
+        x_shifted = min(x_end, W - 1) if x >= 0 else x_start
+        # column left by the pipe
+        x_left = x + self.args.pipe_width
+        
+        if x_end == W:
+            bottom_pipe_img, top_pipe_img = self.get_pipe_imgs(height)
+        
+        for (y_start, y_end) in ((0, height_top), (y - height, y)):
+            if x_shifted > x_start:
+                self.map_win[y_start:y_end, x_start:x_shifted] = self.map_win[y_start:y_end, x_start + 1:x_shifted + 1]
+            if x_end == W:
+                self.map_win[y_start:y_end, W - 1] = (top_pipe_img if y_start == 0 else bottom_pipe_img)[:, W - 1 - x]
+        # column left by the pipe (between the 2 parts, the background is unchanged)
+        if 0 <= x_left < W:
+            self.map_win[:y, x_left] = self.bg_win[:y, x_left]
+    
+    def paint_bird(self):
+        """Paint the Bird on the 'map' and store its bounding box 'bird_rect' = (y_b, x_b, rows, cols).
+        """
+        if self.bird is None:
+            return
+        
+        rows, cols, _ = self.bird.img.shape
+        # find the top-left coordinates of bird image
+        x_b, y_b = self.bird.x + self.pad - cols//2, max(self.bird.y + self.pad - rows//2, 0)
+        
+        # keep the pixels under the bird to erase it
+        self.bird_bg = self.map[y_b:y_b + rows, x_b:x_b + cols].copy()
+        # add the bird: green-screen filtering to display non-square bird shapes
+        np.copyto(self.map[y_b:y_b + rows, x_b:x_b + cols, :], self.bird.img, where=self.bird.pixel_mask)
+        
+        self.bird_rect = (y_b, x_b, rows, cols)
             
     def generate_pipe(self):
         """Generate a new pipe with random height.
@@ -141,7 +377,7 @@ class Environment:
             Otherwise, the pipe is placed at 'pipe_dist[0]' horizontal distance from the previous pipe.
         """
         # random height of the new pipe
-        height = np.random.randint(self.args.pipe_min_height, self.args.window_size[0]-self.args.ground_height-self.args.pipe_dist[1]-self.args.pipe_min_height)
+        height = self.pipe_schedule.next()
     
         # place the first pipe
         if len(self.pipes) == 0:
@@ -158,19 +394,60 @@ class Environment:
         
         return pipe
     
+    def is_collision(self, y, x, rows, cols):
+        """Check analytically if a rectangle intersects with some environment obstacles.
+        The pipes are axis-aligned rectangles, the floor and the window borders are half-planes.
+        
+        Args:
+            'y' (int): row coordinate of the top of the rectangle in the window
+            'x' (int): column coordinate of the left of the rectangle in the window
+            'rows' (int): height of the rectangle
+            'cols' (int): width of the rectangle
+            
+        Return:
+            'isCollision' (bool): indicates if the rectangle intersects with an obstacle
+            
+        Remarks:
+            Equivalent to checking the occupancy grid 'occ' on the rectangle area, without building it.
+        """
+        # y-coordinate of the top of the floor
+        y_floor = self.args.window_size[0] - self.args.ground_height
+        
+        # the window borders and the floor
+        if (y < 0) or (x < 0) or (x + cols > self.args.window_size[1]) or (y + rows > y_floor):
+            return True
+        
+        for pipe in self.pipes:
+            x_p, height = pipe
+            
+            # check that the pipe is inside the window
+            if (x_p < self.args.window_size[1]):
+                # the rectangle is in front of the visible part of the pipe
+                if (max(x_p, 0) < x + cols) and (x < min(x_p + self.args.pipe_width, self.args.window_size[1])):
+                    # y-coordinate of the bottom of the top pipe
+                    height_top = y_floor - height - self.args.pipe_dist[1]
+                    # bottom pipe or top pipe
+                    if (y + rows > y_floor - height) or (y < height_top):
+                        return True
+            else:
+                break
+        
+        return False
+    
     def get_state(self):
         """Return the state of the Bird.
         The state of the bird is composed of:
             - 'y': the y-coordinate of the Bird center ;
             - 'dx': the x-distance between the Bird and the end of the next pipe's opening ; 
-            - 'dy': the y-distance between the Bird and the end of the next pipe's opening. 
+            - 'dy': the y-distance between the Bird and the end of the next pipe's opening ;
+            - 't': the number of time steps since the last jump of the Bird (its vertical velocity only depends on it). 
 
         OLD:
             - 'd': the distance between the Bird Center and center of the next pipe's opening ;
             - 'theta': the angle between the Bird Center and center of the next pipe's opening.
             
         Return:
-            'state' (np.array, [y, dx, dy]): the state of the Bird
+            'state' (np.array, [y, dx, dy, t]): the state of the Bird
             
         Remarks:
             The next pipe is the first pipe the bird has not crossed.
@@ -181,6 +458,7 @@ class Environment:
         # current state
         x = self.bird.x
         y = self.bird.y
+        t = self.bird.t
             
         # coordinates of the center of the next pipe's opening
         next_pipe = list(filter(lambda pipe: pipe[0] + self.args.pipe_width >= self.bird.x - self.args.bird_dims[1], self.pipes))[0]
@@ -194,7 +472,7 @@ class Environment:
 
         dx = x_c - x
         dy = y_c - y
-        state = np.array([y, dx, dy])
+        state = np.array([y, dx, dy, t])
         
         return state
     
@@ -207,15 +485,19 @@ class Environment:
         
         # move the pipes 1 pixel to the left
         self.pipes = [[pipe[0]-1, pipe[1]] for pipe in self.pipes]
+        
+        # update the environment
+        self.update_env()
+        
         # remove the pipes that completely left the screen
         self.pipes = list(filter(lambda pipe: pipe[0]+self.args.pipe_width >= 0, self.pipes))
         
         # add new pipes to compensate for removed pipes
         while len(self.pipes) < n_pipes:
             self.pipes.append(self.generate_pipe())
-        
-        # rebuild the environment
-        self.build_env()
+            # a new pipe generated inside the window needs a full rebuild
+            if self.pipes[-1][0] < self.args.window_size[1]:
+                self.build_env()
         
     
 if __name__ == '__main__':
@@ -4,17 +4,18 @@ Authors:
     Gael Colas
 """
 
-import numpy as np
+import atexit
+
 import matplotlib.pyplot as plt
-import cv2
 
 from util import *
 from args import get_game_args
-from environment import Environment
-from bird import Bird
+from simulator import Simulator
 from agent import AIAgent
+from planner import PlannerAgent
+from profiler import Profiler
 
-class Game:
+class Game(Simulator):
     """Class defining the Game framework.
     
     Attributes:
@@ -29,28 +30,28 @@ class Game:
         't' (int): number of time steps since the beginning of the game
         
         'isHuman' (bool, default=True): whether a human or an AI is playing the Game
-        'agent' (AIAgent, default=None): AI agent playing the game
+        'agent' (AIAgent or PlannerAgent, default=None): AI agent playing the game
         'muteDisplay' (bool, default=False): whether or not to mute the display of the frames
+        'profiler' (Profiler): timers of the phases of each time step (disabled if not 'profile')
+    
+    Remarks:
+        The simulation itself (Bird, Environment, collisions and score) is handled by the headless 'Simulator'.
     """
     
     def __init__(self, args):
-        super(Game).__init__()
-        self.args = args
-        
         # environment parameters
-        self.bird = Bird(args)
-        self.env = Environment(args, bird=self.bird)
+        super(Game, self).__init__(args, render=True)
         
         # game parameters
-        self.score = 0
         self.highscore = load_highscore(args.highscore_filename)
         self.inGame = False
         self.hasJumped = False
-        self.t = 0
         
         # to play with an AI
         self.isHuman = (args.agent == "human")
-        if not self.isHuman:
+        if args.agent == "planner":
+            self.agent = PlannerAgent(args, self)
+        elif not self.isHuman:
             state = self.env.get_state()
             self.agent = AIAgent(args, state)
             # load saved parameters
@@ -58,7 +59,22 @@ class Game:
                 load_agent(self.agent, self.args.save_filename)
             
         self.muteDisplay = False
+        
+        # profiling of the time steps: the summary is printed on exit
+        self.profiler = Profiler(enabled=args.profile, trace_filename=args.profile_trace)
+        self.instrument()
+        if args.profile:
+            atexit.register(self.profiler.report)
 
+    def instrument(self):
+        """Time the phases of the simulation (the Bird and the Environment are rebuilt at each new game)."""
+        self.profiler.wrap(self, "update_score")
+        self.profiler.wrap(self, "fail")
+        self.profiler.wrap(self.bird, "move")
+        self.profiler.wrap(self.env, "scroll")
+        self.profiler.wrap(self.env, "update_env")
+        self.profiler.wrap(self.env, "build_env")
+        self.profiler.wrap(self.env, "get_state")
             
     def reset(self):
         """Reset the environment and the bird position to start a new game.
@@ -73,16 +89,13 @@ class Game:
             update_score(self.highscore, self.args.highscore_filename)
             
         # reset the simulation
-        self.bird = Bird(args)
-        self.env = Environment(args, bird=self.bird)
-        self.score = 0
+        state = super(Game, self).reset()
+        self.instrument()
         self.inGame = False
         self.hasJumped = False
-        self.t = 0
         
         # update the state of the agent
         if not self.isHuman:
-            state = self.env.get_state()
             self.agent.reset(state)
         
         # update the image 
@@ -91,78 +104,62 @@ class Game:
             display_info(self.score, self.highscore, text_handle=self.text_score)  
             plt.draw()
     
-    def fail(self):
-        """Check if we failed the current game.
-        
-        Return:
-            'isCollision' (bool): indicates if we encountered an obstacle.
-        """
-        rows, cols, _ = self.bird.img.shape
-        # find the top-left coordinates of bird image
-        x_b, y_b = self.bird.x + self.env.pad - cols//2, max(self.bird.y + self.env.pad - rows//2, 0)
-        
-        # check if the bird square intersects with some environment obstacles
-        isCollision = (self.env.occ[y_b:y_b + rows, x_b:x_b + cols]).any()
-        
-        return isCollision
-    
     def update_score(self):
         """Update the score when the middle of a pipe is crossed.
         
         Return:
             'isCrossed' (bool): indicate that the middle of the next pipe has been crossed
         """
-        isCrossed = np.any([self.bird.x  == (pipe[0] + self.args.pipe_width//2) for pipe in self.env.pipes])
-        
-        if isCrossed:
-            # update the score
-            self.score += 1
-            # display the new score
-            if not self.muteDisplay:
-                display_info(self.score, self.highscore, text_handle=self.text_score)  
+        isCrossed = super(Game, self).update_score()
+        
+        # display the new score
+        if isCrossed and not self.muteDisplay:
+            display_info(self.score, self.highscore, text_handle=self.text_score)  
                 
         return isCrossed
     
     def step(self):
         """Play one time step in the game.
         """
-        # update the score
-        isScoreUpdated = self.update_score()
+        with self.profiler.phase("Game.step"):
+            self.play_step()
+
+    def play_step(self):
+        """Play one time step in the game (see 'step'), the phases being timed by the profiler.
+        """
+        # if the AI is playing: take an action
+        action = 0
+        if not self.isHuman:
+            with self.profiler.phase("Agent.choose_action"):
+                action = self.agent.choose_action()
+        
+        # simulate the time step
+        with self.profiler.phase("Simulator.step"):
+            new_state, isScoreUpdated, isFail = super(Game, self).step(action)
         
         # the player hit an obstacle
-        isFail = self.fail()
         if isFail:
             self.inGame = False
-            # display an explosion instead of the bird image
-            self.bird.img = jpg2numpy(self.args.explosion_sprite, self.args.explosion_dims)
-
-        # if the AI is playing: take an action
-        if not self.isHuman:
-            self.agent.choose_action()     
-            
-        # compute the new bird position
-        self.bird.move()
- 
-        # scroll 1 frame and generate the new environment
-        new_state = self.env.scroll()
        
-        # if the AI is playing: set the new state
+        # if the AI is playing: feed the transition information to the agent
         if not self.isHuman:
-            # get the new_state
-            new_state = self.env.get_state()
-            # feed the transition information to the agent
-            self.agent.set_transition(new_state, isScoreUpdated, isFail) 
+            with self.profiler.phase("Agent.set_transition"):
+                self.agent.set_transition(new_state, isScoreUpdated, isFail) 
             
         # only display 1 frame every 'n_frames' frames for fluidity
         if not self.muteDisplay and (self.fail() or (self.isHuman and (self.t % self.args.n_frames_human == 0)) or (not self.isHuman and (self.t % self.args.n_frames_ai == 0))): 
-            # change the displayed image to account for changes
-            self.im.set_data(self.env.map)
-            # update the image without pausing
-            plt.draw()
+            with self.profiler.phase("display"):
+                # change the displayed image to account for changes
+                self.im.set_data(self.env.map)
+                # update the image without pausing
+                plt.draw()
             
-        # new time step
-        self.t += 1
         self.hasJumped = False
+        
+        # if the AI is playing: start a new simulation
+        if isFail and not self.isHuman:
+            self.reset()
+            self.inGame = True
                 
     def play(self):
         """Launch a game.
@@ -173,6 +170,7 @@ class Game:
             N : reset game
             M : mute display
             Z : save AI data
+            P : print the profiling summary
             Q : quit
         """ 
         # get useful handles
@@ -213,15 +211,26 @@ class Game:
             # mute the display if M is pressed
             elif event.key == "m":
                 self.muteDisplay = not self.muteDisplay
+            # print the profiling summary if P is pressed
+            elif event.key == "p":
+                if self.args.profile:
+                    print(self.profiler.summary())
             # save the AI agent parameters if S is pressed
             elif event.key == "z":
-                if not self.isHuman:
-                    save_agent(self.agent, self.args.save_filename)
+                if self.args.agent == "ai":
+                    save_agent(self.agent, self.args.save_filename, self.args.compress_save)
+            
+        # window closed (by Q or by the window manager): finish the background work of the AI agent
+        def close_onclose(event):
+            if self.args.agent == "ai":
+                self.agent.close()
             
         # right click to start the game
         cid_start = fig.canvas.mpl_connect('button_press_event', start_onclick)
         # keyboard input to interact with the game
         cid_jump = fig.canvas.mpl_connect('key_press_event', jump_onkey)
+        # window closed
+        cid_close = fig.canvas.mpl_connect('close_event', close_onclose)
         
         # disconnect the events
         if False:
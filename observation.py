@@ -0,0 +1,184 @@
+"""Pixel observations of the Game for pixel-based agents.
+
+Authors:
+    Gael Colas
+"""
+
+import numpy as np
+import cv2
+
+from util import make_rng, AGENT_STREAM
+from args import get_game_args
+from simulator import Simulator
+
+
+class FrameStack:
+    """Preallocated ring buffer of the last 'n_frames' observed frames.
+
+    Attributes:
+        'n_frames' (int): number of stacked frames
+        'buffer' (np.array, shape=(2*n_frames, obs_dims), dtype=uint8): each frame is written twice, 'n_frames' slots apart
+        'idx' (int): slot of the oldest frame of the stack
+
+    Remarks:
+        Writing each frame twice keeps the last 'n_frames' frames contiguous and in chronological order:
+        the stack is a view on the buffer, it is never copied nor rolled.
+    """
+
+    def __init__(self, n_frames, frame_dims):
+        super(FrameStack).__init__()
+        self.n_frames = n_frames
+        self.buffer = np.zeros((2*n_frames,) + tuple(frame_dims), dtype=np.uint8)
+        self.idx = 0
+
+    def reset(self, frame):
+        """Fill the stack with copies of the first frame of a game.
+
+        Args:
+            'frame' (np.array, shape=obs_dims, dtype=uint8): first frame (may be written in 'next_slot')
+
+        Return:
+            'frames' (np.array, shape=(n_frames, obs_dims), dtype=uint8): view on the stacked frames, oldest first
+        """
+        self.buffer[:] = frame
+        self.idx = 0
+
+        return self.get()
+
+    def get(self):
+        """Return a view on the stacked frames, oldest first (valid until the next frame is written)."""
+        return self.buffer[self.idx: self.idx + self.n_frames]
+
+    def next_slot(self):
+        """Return the slot of the oldest frame, where the next frame is written in place before calling 'push'."""
+        return self.buffer[self.idx]
+
+    def push(self):
+        """Add the frame written in 'next_slot' to the stack, the oldest frame is dropped.
+
+        Return:
+            'frames' (np.array, shape=(n_frames, obs_dims), dtype=uint8): view on the stacked frames, oldest first
+        """
+        self.buffer[self.idx + self.n_frames] = self.buffer[self.idx]
+        self.idx = (self.idx + 1) % self.n_frames
+
+        return self.get()
+
+
+class PixelObservation:
+    """Convert the RGB-pixel array of the environment into small grayscale frames.
+
+    Attributes:
+        'obs_dims' (tuple of int, (rows, cols)): dimensions of the observed frames
+        'small' (np.array, shape=(obs_dims, 3), dtype=uint8): preallocated downsampled RGB frame
+
+    Remarks:
+        The window is first downsampled and then converted to grayscale: the full-size map is only read once, never copied.
+        The downsampling only reads the pixel nearest to the center of each observed pixel:
+        an observation costs about half a time step of the rendered simulation, 'frame_skip' divides this cost further.
+    """
+
+    def __init__(self, obs_dims):
+        super(PixelObservation).__init__()
+        self.obs_dims = tuple(obs_dims)
+        self.small = np.zeros(self.obs_dims + (3,), dtype=np.uint8)
+
+    def __call__(self, map_win, out):
+        """Write the observation of the RGB-pixel array 'map_win' into 'out'.
+
+        Args:
+            'map_win' (np.array, shape=(window_size, 3), dtype=uint8): RGB-pixel array of the window
+            'out' (np.array, shape=obs_dims, dtype=uint8): output grayscale frame
+
+        Return:
+            'out' (np.array, shape=obs_dims, dtype=uint8): output grayscale frame
+        """
+        # nearest-neighbor sampling: the objects are large flat areas, interpolating them would cost twice as much
+        cv2.resize(map_win, dsize=(self.obs_dims[1], self.obs_dims[0]), dst=self.small, interpolation=cv2.INTER_NEAREST)
+        cv2.cvtColor(self.small, cv2.COLOR_RGB2GRAY, dst=out)
+
+        return out
+
+
+class PixelSimulator(Simulator):
+    """Headless simulation of the Game observed through the pixels of the window.
+    Drop-in replacement of 'Simulator' in the headless step loop: 'reset' and 'step' return stacked frames instead of the state.
+
+    Attributes:
+        'frame_skip' (int): number of time steps played for each action of the agent (only the last frame is observed)
+        'observe' (PixelObservation): conversion of the window into a small grayscale frame
+        'frames' (FrameStack): the last 'frame_stack' observed frames
+
+    Remarks:
+        The returned frames are a view on the ring buffer: copy them to keep them after the next step.
+    """
+
+    def __init__(self, args):
+        self.frame_skip = args.frame_skip
+        self.observe = PixelObservation(args.obs_dims)
+        self.frames = FrameStack(args.frame_stack, args.obs_dims)
+
+        super(PixelSimulator, self).__init__(args, render=True)
+        # first observation
+        self.frames.reset(self.observe(self.env.map_win, self.frames.next_slot()))
+
+    def reset(self):
+        """Reset the environment and the bird position to start a new game.
+
+        Return:
+            'frames' (np.array, shape=(frame_stack, obs_dims), dtype=uint8): the initial observation, repeated
+        """
+        super(PixelSimulator, self).reset()
+
+        return self.frames.reset(self.observe(self.env.map_win, self.frames.next_slot()))
+
+    def step(self, action=0):
+        """Play 'frame_skip' time steps in the game with the same action.
+
+        Args:
+            'action' (int, 0 or 1): action performed at the current time step
+                    action = 1 if jumping, 0 otherwise
+                    the jump is only performed at the first time step
+
+        Return:
+            'frames' (np.array, shape=(frame_stack, obs_dims), dtype=uint8): the last observed frames, oldest first
+            'n_points' (int): number of points earned during the skipped time steps
+            'isFail' (bool): whether the Game has been failed
+        """
+        n_points = 0
+        for k in range(self.frame_skip):
+            _, isScoreUpdated, isFail = super(PixelSimulator, self).step(action if k == 0 else 0)
+            n_points += isScoreUpdated
+            if isFail:
+                break
+
+        self.observe(self.env.map_win, self.frames.next_slot())
+
+        return self.frames.push(), n_points, isFail
+
+
+if __name__ == '__main__':
+    """Measure the cost of the observations compared to the simulation."""
+    import time
+
+    # get arguments needed to play the Game
+    args = get_game_args()
+    sim = PixelSimulator(args)
+    # random actions: stream derived from the master seed
+    rng = make_rng(args.seed, AGENT_STREAM)
+
+    T = 5000
+    sim_time, obs_time = 0., 0.
+    for t in range(T):
+        start = time.perf_counter()
+        _, _, isFail = Simulator.step(sim, int(rng.random() < 0.05))
+        sim_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        sim.observe(sim.env.map_win, sim.frames.next_slot())
+        sim.frames.push()
+        obs_time += time.perf_counter() - start
+
+        if isFail:
+            sim.reset()
+    print("simulation {:.1f} us/step | observation {:.1f} us/step".format(1e6*sim_time/T, 1e6*obs_time/T))
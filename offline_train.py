@@ -0,0 +1,47 @@
+"""Offline training of the AI agent from recorded transition logs: no game is played.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+
+from util import *
+from args import get_game_args
+from agent import AIAgent
+from transition_log import rebuild_mdp
+
+
+def train_offline(args):
+    """Train the AI agent on the transition logs 'offline_logs': the MDP is built from all the logs and solved once.
+
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+
+    Return:
+        'agent' (AIAgent): the trained AI agent
+    """
+    agent = AIAgent(args, None)
+    # the counts of the logs are added to the ones of the saved agent
+    if args.load_save:
+        load_agent(agent, args.save_filename)
+
+    start = time.perf_counter()
+    n_records = rebuild_mdp(agent, args.offline_logs)
+    print("{} transitions recorded in {:.2f} s".format(n_records, time.perf_counter() - start))
+
+    agent.update_mdp_parameters()
+    print("MDP solved with {}: {:.0f} iterations in {:.2f} s".format(args.solver, agent.n_iter, agent.solve_time))
+
+    return agent
+
+
+if __name__ == '__main__':
+    # get arguments needed to play the Game
+    args = get_game_args()
+    if not args.offline_logs:
+        raise ValueError("Give the directories of the transition logs to train on with '--offline_logs'.")
+    # train the AI agent on the logs
+    agent = train_offline(args)
+    # save the AI agent parameters
+    save_agent(agent, args.save_filename, args.compress_save)
@@ -0,0 +1,216 @@
+"""Model-based agent planning its actions with a fast forward model of the Game.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+
+import numpy as np
+
+from util import *
+from args import get_game_args
+from bird import get_displacements
+
+
+class PlannerAgent:
+    """Agent choosing the action whose future survives the longest, by beam search over the jump/no-jump tree.
+    The agent does not learn: it reads the Bird and the pipes of the simulation and plans at every time step.
+
+    Attributes:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'sim' (Simulator): the simulation played by the agent (its Bird and Environment are read, never modified)
+        'horizon' (int): maximum number of time steps of the planned futures
+        'beam_width' (int): maximum number of futures kept at each time step
+        'budget' (float): maximum planning time per time step (in seconds)
+        't_max' (int): number of time steps after a jump from which the Bird falls at the maximum velocity
+        'steps' (np.array, shape=(t_max+1,), dtype=int): integer move of the Bird 't' time steps after a jump (see 'get_displacements')
+        'y', 't', 'first_action' (np.array, shape=(beam_width,), dtype=int): preallocated beam of futures:
+                Bird position, time since its last jump (clipped at 't_max') and first action of each future
+        'y_children', 't_children', 'first_action_children' (np.array, shape=(2*beam_width,), dtype=int): preallocated children of the beam
+        'action' (int): the current action
+                action = 1 if jumping, 0 otherwise
+        'depth' (int): number of time steps survived by the best future planned at the last time step
+
+    Remarks:
+        The forward model only holds (y, t) per future: the pipes are shared by all the futures and only scroll.
+        The pipes generated after the current ones are unknown: they are ignored.
+        Futures reaching the same (y, t) are merged: the tree of 2^horizon sequences collapses to a few hundred distinct states.
+    """
+
+    def __init__(self, args, sim):
+        super(PlannerAgent).__init__()
+
+        self.args = args
+        self.sim = sim
+        self.horizon = args.plan_horizon
+        self.beam_width = args.beam_width
+        self.budget = args.plan_budget / 1000
+
+        # integer forward model of the Bird dynamics: same positions as 'move_birds' (up to the clipping at 0)
+        displacements = get_displacements(args)
+        self.t_max = len(displacements) - 1
+        self.steps = np.floor(-displacements).astype(int)
+
+        # preallocated beam and children of the beam
+        self.y = np.zeros(self.beam_width, dtype=int)
+        self.t = np.zeros(self.beam_width, dtype=int)
+        self.first_action = np.zeros(self.beam_width, dtype=int)
+        self.y_children = np.zeros(2*self.beam_width, dtype=int)
+        # the jumping children (odd slots) are always 1 time step after their jump
+        self.t_children = np.tile([0, 1], self.beam_width)
+        self.first_action_children = np.zeros(2*self.beam_width, dtype=int)
+
+        self.action = 0
+        self.depth = 0
+
+    def reset(self, state):
+        """Start a new game: nothing is learned."""
+        self.action = 0
+
+    def set_transition(self, new_state, isScoreUpdated, isFail):
+        """Observe a transition: nothing is learned, the next action is planned from the simulation itself."""
+        pass
+
+    def choose_action(self):
+        """Plan the next action.
+
+        Return:
+            'action' (int, 0 or 1): the first action of the future surviving the longest
+                    action = 1 if jumping, 0 otherwise
+        """
+        self.action, self.depth = self.plan(self.sim.bird.y, self.sim.bird.t, np.array(self.sim.env.pipes, dtype=int).reshape(-1, 2))
+
+        return self.action
+
+    def safe_band(self, pipes):
+        """Compute the positions of the Bird surviving each of the next time steps.
+        The Bird only moves vertically: at each time step, the positions without collision form a band [y_min, y_max].
+
+        Args:
+            'pipes' (np.array, shape=(n_pipes, 2), dtype=int): current pipes (x = coord of front of pipe ; height = height of bottom pipe)
+
+        Return:
+            'y_min', 'y_max' (np.array, shape=(horizon+1,), dtype=int): bounds of the safe Bird center positions 'k' time steps ahead
+
+        Remarks:
+            Same geometry as 'is_collision' for the Bird square: the pipes scrolled 'k' pixels after 'k' time steps.
+        """
+        H, W = self.args.window_size
+        rows, cols = self.args.bird_dims
+        # y-coordinate of the top of the floor
+        y_floor = H - self.args.ground_height
+        x_b = self.sim.bird.x - cols//2
+
+        # the pipes in front of the Bird at each time step
+        pipes_x = pipes[:, 0] - np.arange(self.horizon + 1)[:, np.newaxis]
+        isFront = (pipes_x < W) & (np.maximum(pipes_x, 0) < x_b + cols) & (x_b < np.minimum(pipes_x + self.args.pipe_width, W))
+
+        # bounds of the top of the Bird square: the ceiling or the top pipes, the floor or the bottom pipes
+        y_top = np.max(np.where(isFront, y_floor - pipes[:, 1] - self.args.pipe_dist[1], 0), axis=-1, initial=0)
+        y_bottom = np.min(np.where(isFront, y_floor - pipes[:, 1], y_floor), axis=-1, initial=y_floor)
+
+        return y_top + rows//2, y_bottom - rows + rows//2
+
+    def get_targets(self, y_min, y_max):
+        """Compute the position the futures should aim at each time step: the center of the next narrow band.
+
+        Args:
+            'y_min', 'y_max' (np.array, shape=(horizon+1,), dtype=int): bounds of the safe Bird positions (see 'safe_band')
+
+        Return:
+            'target' (np.array, shape=(horizon+1,), dtype=int): center of the band of the next time step in front of a pipe
+                    (the center of the current band if no pipe is ahead within the horizon)
+        """
+        y_center = (y_min + y_max) // 2
+        isNarrow = y_max - y_min < np.max(y_max - y_min)
+        # index of the next narrow time step, from the end
+        idx = np.where(isNarrow, np.arange(len(y_min)), len(y_min))
+        idx = np.minimum.accumulate(idx[::-1])[::-1]
+
+        return np.where(idx < len(y_min), y_center[np.minimum(idx, len(y_min) - 1)], y_center)
+
+    def plan(self, y, t, pipes):
+        """Beam search over the futures of the Bird.
+
+        Args:
+            'y' (int): current column pixel coordinate of the Bird center
+            't' (int): current number of time steps since the last jump
+            'pipes' (np.array, shape=(n_pipes, 2), dtype=int): current pipes (x = coord of front of pipe ; height = height of bottom pipe)
+
+        Return:
+            'action' (int, 0 or 1): the first action of the future surviving the longest
+                    ties are broken by the distance to the center of the next narrow band (see 'get_targets'), then by not jumping
+            'depth' (int): number of time steps survived by this future
+        """
+        start = time.perf_counter()
+        y_min, y_max = self.safe_band(pipes)
+        # the futures are kept close to the center of the band of the time step at which a pipe is next entered
+        target = self.get_targets(y_min, y_max)
+
+        # root of the tree: both actions are possible
+        n = 1
+        self.y[0], self.t[0], self.first_action_children[:2] = y, min(t, self.t_max), (0, 1)
+        # a future is encoded in 1 integer, sorted by state (y, t) and then by first action
+        T = 2*(self.t_max + 1)
+        best_depth = 0
+        for depth in range(1, self.horizon + 1):
+            # the 2 children of each future: not jumping (even slots) and jumping (odd slots)
+            y_children, t_children = self.y_children[:2*n], self.t_children[:2*n]
+            np.minimum(self.t[:n] + 1, self.t_max, out=t_children[0::2])
+            np.add(self.y[:n], self.steps[t_children[0::2]], out=y_children[0::2])
+            np.add(self.y[:n], self.steps[1], out=y_children[1::2])
+            if depth > 1:
+                self.first_action_children[0:2*n:2] = self.first_action[:n]
+                self.first_action_children[1:2*n:2] = self.first_action[:n]
+
+            # the positions out of the band collide (the negative positions, clipped at 0 by 'move_birds', too)
+            keys = (y_children*T + 2*t_children + self.first_action_children[:2*n])[(y_children >= y_min[depth]) & (y_children <= y_max[depth])]
+            if len(keys) == 0:
+                break
+
+            # merge the futures reaching the same state: keep the one not jumping first
+            keys.sort()
+            isFirst = np.ones(len(keys), dtype=bool)
+            np.not_equal(keys[1:] // 2, keys[:-1] // 2, out=isFirst[1:])
+            keys = keys[isFirst]
+
+            # keep the futures closest to the center of the next narrow band
+            if len(keys) > self.beam_width:
+                keys = keys[np.argsort(np.abs(keys // T - target[depth]), kind='stable')[:self.beam_width]]
+            n = len(keys)
+            self.y[:n], rest = np.divmod(keys, T)
+            self.t[:n], self.first_action[:n] = np.divmod(rest, 2)
+            best_depth = depth
+
+            # per-frame latency budget
+            if time.perf_counter() - start > self.budget:
+                break
+
+        # best future at the last depth: the closest to the center of the next narrow band
+        best_action = int(self.first_action[np.argmin(np.abs(self.y[:n] - target[best_depth]))]) if best_depth > 0 else 0
+
+        return best_action, best_depth
+
+
+if __name__ == '__main__':
+    """Let the planner play headless games and measure its decision latency."""
+    from simulator import Simulator
+
+    # get arguments needed to play the Game
+    args = get_game_args()
+    sim = Simulator(args)
+    agent = PlannerAgent(args, sim)
+
+    scores, latencies = [], []
+    for episode in range(args.n_episodes):
+        isFail = False
+        # the planner rarely fails: the games are stopped at 100 points
+        while not isFail and sim.score < 100:
+            start = time.perf_counter()
+            action = agent.choose_action()
+            latencies.append(time.perf_counter() - start)
+            new_state, isScoreUpdated, isFail = sim.step(action)
+        scores.append(sim.score)
+        sim.reset()
+    print("score: mean {:.1f} | max {} | latency: p50 {:.0f} us | p99 {:.0f} us".format(np.mean(scores), np.max(scores), 1e6*np.percentile(latencies, 50), 1e6*np.percentile(latencies, 99)))
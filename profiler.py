@@ -0,0 +1,184 @@
+"""Low-overhead profiling of the phases of a time step of the Game.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+import bisect
+import functools
+
+import numpy as np
+import ujson as json
+
+
+class StreamingHistogram:
+    """Histogram of durations with log-spaced bins: the samples are counted, never stored.
+
+    Attributes:
+        'edges' (list of float): upper edges of the bins (in seconds), 'bins_per_decade' per decade from 'min_time' to 'max_time'
+        'counts' (list of int): number of samples in each bin (the last bin counts the samples longer than 'max_time')
+        'n' (int): number of samples
+        'total' (float): sum of the samples
+        'max' (float): longest sample
+    """
+
+    def __init__(self, min_time=1e-7, max_time=10., bins_per_decade=10):
+        super(StreamingHistogram).__init__()
+        n_bins = int(round(np.log10(max_time / min_time) * bins_per_decade))
+        self.edges = np.geomspace(min_time, max_time, n_bins + 1).tolist()
+        self.counts = [0] * (len(self.edges) + 1)
+        self.n = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, duration):
+        """Count a sample (in seconds)."""
+        self.counts[bisect.bisect_left(self.edges, duration)] += 1
+        self.n += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, q):
+        """Approximate q-th percentile of the samples: upper edge of the bin of the sample of rank q (at most 'max').
+
+        Args:
+            'q' (float): percentile, between 0 and 100
+
+        Return:
+            'duration' (float): q-th percentile (in seconds)
+        """
+        rank = int(np.ceil(q / 100 * self.n))
+        cumsum = 0
+        for k, count in enumerate(self.counts):
+            cumsum += count
+            if cumsum >= max(rank, 1):
+                return min(self.edges[k] if k < len(self.edges) else self.max, self.max)
+
+        return self.max
+
+
+class Phase:
+    """Context manager timing a phase of a Profiler."""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+
+class NullPhase:
+    """Context manager of a disabled Profiler: does nothing."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Profiler:
+    """Per-phase timers of the time steps of the Game.
+
+    Attributes:
+        'enabled' (bool): whether the phases are timed (a disabled Profiler costs an empty 'with' block per phase)
+        'histograms' (dict, {name: StreamingHistogram}): durations of each phase, in order of first occurrence
+        'trace_filename' (str): file where the Chrome trace of the phases is written (None if no trace is recorded)
+        'events' (list of dict): recorded trace events (at most 'max_events')
+        'origin' (float): time origin of the trace events
+
+    Remarks:
+        The time is read with the monotonic clock 'time.perf_counter'.
+        The phases can be nested (e.g. 'Environment.build_env' inside 'Environment.scroll'): the share of each phase is given relative to the root phase.
+        The trace can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, enabled=True, trace_filename=None, max_events=10**6):
+        super(Profiler).__init__()
+        self.enabled = enabled
+        self.histograms = {}
+        self.trace_filename = trace_filename
+        self.max_events = max_events
+        self.events = []
+        self.origin = time.perf_counter()
+        self.null_phase = NullPhase()
+
+    def phase(self, name):
+        """Return a context manager timing the phase 'name'."""
+        return Phase(self, name) if self.enabled else self.null_phase
+
+    def add(self, name, start, end):
+        """Record a phase 'name' timed from 'start' to 'end' (in seconds, from 'time.perf_counter')."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = StreamingHistogram()
+        histogram.add(end - start)
+
+        if self.trace_filename is not None and len(self.events) < self.max_events:
+            self.events.append({'name': name, 'ph': "X", 'ts': 1e6*(start - self.origin), 'dur': 1e6*(end - start), 'pid': 0, 'tid': 0})
+
+    def wrap(self, obj, method_name, name=None):
+        """Time every call of the method 'method_name' of the object 'obj' as the phase 'name'.
+        The method is replaced by a timed wrapper on the instance only: the class and the other instances are not affected.
+
+        Args:
+            'obj' (object): instance whose method is timed
+            'method_name' (str): name of the method
+            'name' (str, default=None): name of the phase (names of the class defining the method and of the method if None)
+        """
+        if not self.enabled:
+            return
+        if name is None:
+            # the class whose implementation is called (e.g. 'Game.update_score', but 'Simulator.fail')
+            owner = next(cls for cls in type(obj).__mro__ if method_name in vars(cls))
+            name = "{}.{}".format(owner.__name__, method_name)
+        method = getattr(type(obj), method_name).__get__(obj)
+
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.add(name, start, time.perf_counter())
+            return result
+
+        setattr(obj, method_name, timed_method)
+
+    def summary(self):
+        """Return the table of the durations of each phase (in microseconds)."""
+        if not self.histograms:
+            return "No profiled phase."
+
+        # root phase: the phase with the largest total time (it contains the other ones)
+        root_total = max(histogram.total for histogram in self.histograms.values())
+        width = max(len(name) for name in self.histograms)
+        lines = ["{:<{}} {:>8} {:>10} {:>10} {:>10} {:>10} {:>7}".format("phase", width, "calls", "mean_us", "p50_us", "p99_us", "max_us", "share")]
+        for name, histogram in self.histograms.items():
+            lines.append("{:<{}} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>6.1f}%".format(
+                name, width, histogram.n, 1e6*histogram.total/histogram.n, 1e6*histogram.percentile(50), 1e6*histogram.percentile(99), 1e6*histogram.max, 100*histogram.total/root_total))
+
+        return "\n".join(lines)
+
+    def write_trace(self):
+        """Write the recorded phases to the Chrome trace file 'trace_filename' (if any)."""
+        if self.trace_filename is None:
+            return
+
+        with open(self.trace_filename, "w") as out_file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': "ms"}, out_file)
+        print("The profiling trace has been saved to: {}".format(self.trace_filename))
+
+    def report(self):
+        """Print the summary and write the trace."""
+        if not self.enabled:
+            return
+
+        print(self.summary())
+        self.write_trace()
@@ -0,0 +1,180 @@
+"""Parallel training of the AI agent: rollout worker processes feeding a central learner.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+from util import *
+from args import get_game_args
+from simulator import Simulator
+from discretizer import Discretizer
+from agent import AIAgent
+from shared_policy import SharedPolicy
+
+
+def rollout_worker(worker_id, args, grids, axes, policy_name, tasks, results):
+    """Play headless games with the latest policy of the learner and send back the observed transition counts.
+
+    Args:
+        'worker_id' (int): index of the worker
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'grids', 'axes': discretization of the state of the learner (see 'Discretizer')
+        'policy_name' (str): name of the SharedPolicy published by the learner
+        'tasks' (Queue): tasks sent by the learner: (n_episodes, eps), None to stop
+        'results' (Queue): transition counts sent to the learner (see 'play_task')
+    """
+    discretizer = Discretizer(grids, axes)
+    # the policy of the learner is read in place: it always reflects its last solve
+    policy = SharedPolicy(name=policy_name)
+
+    # random streams of the worker: its games differ from the ones of the other workers
+    sim = Simulator(args, stream=(WORKER_STREAM, worker_id, ENV_STREAM))
+    rng = make_rng(args.seed, WORKER_STREAM, worker_id, AGENT_STREAM)
+
+    try:
+        for task in iter(tasks.get, None):
+            results.put(play_task(sim, discretizer, policy.actions, rng, *task))
+    finally:
+        policy.close()
+
+def play_task(sim, discretizer, actions, rng, n_episodes, eps):
+    """Play 'n_episodes' games with an Epsilon-Greedy policy.
+
+    Args:
+        'sim' (Simulator): headless simulation of the Game
+        'discretizer' (Discretizer): discretization of the state
+        'actions' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+        'rng' (np.random.Generator): random stream of the exploration
+        'n_episodes' (int): number of games to play
+        'eps' (float): epsilon-greedy coefficient (see 'AIAgent.choose_action')
+
+    Return:
+        'transitions' (tuple of np.array, (s, a, new_s, count)): number of occurrences of each observed transition
+        'rewards' (tuple of np.array, (new_s, reward_sum, count)): sum and number of the rewards observed in each new state
+        'scores' (list of int): score of each game
+        'n_steps' (int): number of time steps played
+    """
+    s_list, a_list, new_s_list, reward_list, scores = [], [], [], [], []
+    for episode in range(n_episodes):
+        s = discretizer.get_state_idx(sim.reset())
+        isFail = False
+        while not isFail:
+            # Epsilon-Greedy action
+            if rng.random() < eps:
+                action = int(actions[s])
+            else:
+                action = int(rng.random() < 0.01)
+
+            new_state, isScoreUpdated, isFail = sim.step(action)
+            new_s = discretizer.get_state_idx(new_state, isFail)
+
+            s_list.append(s)
+            a_list.append(action)
+            new_s_list.append(new_s)
+            reward_list.append(100 if isScoreUpdated else (-1000 if isFail else 1))
+            s = new_s
+        scores.append(sim.score)
+
+    # compact deltas: the repeated transitions and rewards are aggregated
+    num_states = discretizer.num_states
+    keys, counts = np.unique((2*np.array(s_list) + np.array(a_list))*num_states + np.array(new_s_list), return_counts=True)
+    rows, new_s = np.divmod(keys, num_states)
+    reward_states, inverse = np.unique(new_s_list, return_inverse=True)
+    reward_sums = np.bincount(inverse, weights=reward_list)
+
+    return (rows // 2, rows % 2, new_s, counts), (reward_states, reward_sums, np.bincount(inverse)), scores, len(s_list)
+
+def train_parallel(args):
+    """Let the AI agent learn from 'n_episodes' games played by 'n_workers' rollout processes.
+
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+
+    Return:
+        'agent' (AIAgent): the trained AI agent
+
+    Remarks:
+        The learner merges the transition counts of each task (see 'episodes_per_task') as soon as it is received,
+        solves the approximate MDP and publishes the new greedy policy in a SharedPolicy, where all the workers read it.
+        A worker finishes its task with the policy of the time it was sent (up to the updates made by the other tasks).
+    """
+    # the workers only send transition counts: the raw transitions are not available
+    if args.transition_log is not None:
+        raise ValueError("The transition log is not supported with parallel rollouts: use 'n_workers' = 1.")
+
+    # the learner: only the MDP is used, it does not play
+    agent = AIAgent(args, None)
+    if args.load_save:
+        load_agent(agent, args.save_filename)
+    num_states = agent.mdp_data['num_states']
+
+    # current policy, shared with the workers
+    policy = SharedPolicy(num_states)
+    policy.publish(agent.mdp_data['value'], agent.mdp_data['policy'])
+
+    tasks, results = mp.Queue(), mp.Queue()
+    workers = [mp.Process(target=rollout_worker, args=(k, args, agent.discretizer.grids, agent.discretizer.axes, policy.name, tasks, results), daemon=True) for k in range(args.n_workers)]
+    try:
+        for worker in workers:
+            worker.start()
+
+        # each worker has one task in progress and one task waiting
+        n_sent = 0
+        for k in range(2*args.n_workers):
+            if n_sent < args.n_episodes:
+                tasks.put((min(args.episodes_per_task, args.n_episodes - n_sent), agent.eps))
+                n_sent += args.episodes_per_task
+
+        episode, best_score, n_steps = 0, 0, 0
+        start = time.time()
+        while episode < args.n_episodes:
+            (s, a, new_s, counts), (reward_states, reward_sums, reward_counts), scores, task_steps = results.get()
+
+            # merge the observations of the worker
+            agent.mdp_data['transitions'].add(s, a, new_s, counts)
+            np.add.at(agent.mdp_data['reward_counts'][:, 0], reward_states, reward_sums)
+            np.add.at(agent.mdp_data['reward_counts'][:, 1], reward_states, reward_counts)
+            for score in scores:
+                episode += 1
+                best_score = max(best_score, score)
+                if episode % args.log_every == 0:
+                    print("Episode {}: best score {} | {:.0f} steps/s | last solve: {:.0f} iterations in {:.1f} ms".format(episode, best_score, (n_steps + task_steps) / (time.time() - start), agent.n_iter, 1e3*agent.solve_time))
+                # the agent becomes more greedy after each game
+                agent.reset(None)
+            n_steps += task_steps
+
+            # solve the MDP and broadcast the new policy
+            agent.update_mdp_parameters()
+            policy.publish(agent.mdp_data['value'], agent.mdp_data['policy'])
+
+            if n_sent < args.n_episodes:
+                tasks.put((min(args.episodes_per_task, args.n_episodes - n_sent), agent.eps))
+                n_sent += args.episodes_per_task
+
+        # stop the workers
+        for worker in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        policy.close()
+        policy.unlink()
+
+    return agent
+
+
+if __name__ == '__main__':
+    # get arguments needed to play the Game
+    args = get_game_args()
+    # train the AI agent with parallel rollouts
+    agent = train_parallel(args)
+    # save the AI agent parameters
+    save_agent(agent, args.save_filename, args.compress_save)
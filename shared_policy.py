@@ -0,0 +1,121 @@
+"""Policy of the AI agent shared by several processes without copies.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# size of the header (version counter and number of states), a cache line
+HEADER_SIZE = 64
+
+
+class SharedPolicy:
+    """Value function and greedy action table stored in a shared memory block.
+    One process (the learner) publishes new policies, any number of processes read them in place.
+
+    Attributes:
+        'shm' (SharedMemory): the shared memory block
+        'num_states' (int): the number of discretized states
+        'header' (np.array, shape=(2,), dtype=uint64): version counter and number of states
+        'value' (np.array, shape=(num_states,), dtype=float64): value function
+        'actions' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+                action = 1 if jumping, 0 otherwise
+
+    Remarks:
+        The version counter is a sequence lock: it is odd while a policy is being written and increases by 2 at each publication.
+        A single greedy action is read atomically: actors can index 'actions' directly at each time step.
+        'snapshot' returns a consistent copy of the whole policy.
+    """
+
+    def __init__(self, num_states=None, name=None):
+        """Create a new shared policy of 'num_states' states, or attach to the existing shared policy 'name'."""
+        super(SharedPolicy).__init__()
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + num_states*(np.dtype(np.float64).itemsize + 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((2,), dtype=np.uint64, buffer=self.shm.buf)
+        if name is None:
+            self.header[:] = (0, num_states)
+        self.num_states = int(self.header[1])
+
+        self.value = np.ndarray((self.num_states,), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.actions = np.ndarray((self.num_states,), dtype=np.int8, buffer=self.shm.buf, offset=HEADER_SIZE + self.value.nbytes)
+
+    @property
+    def name(self):
+        """Name of the shared memory block, to attach to the policy from another process."""
+        return self.shm.name
+
+    @property
+    def version(self):
+        """Number of published policies."""
+        return int(self.header[0]) // 2
+
+    def publish(self, value, policy):
+        """Publish a new policy.
+
+        Args:
+            'value' (np.array, shape=(num_states,)): value function
+            'policy' (np.array, shape=(num_states,), dtype=int8): greedy action in each state (see 'greedy_policy')
+        """
+        self.header[0] += 1
+        self.value[:] = value
+        self.actions[:] = policy
+        self.header[0] += 1
+
+    def snapshot(self):
+        """Return a consistent copy of the current policy.
+
+        Return:
+            'version' (int): version of the policy
+            'value' (np.array, shape=(num_states,)): value function
+            'actions' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+        """
+        while True:
+            start = int(self.header[0])
+            if start % 2 == 0:
+                value, actions = self.value.copy(), self.actions.copy()
+                if int(self.header[0]) == start:
+                    return start // 2, value, actions
+            # a policy is being published
+            time.sleep(0)
+
+    def close(self):
+        """Detach from the shared memory block."""
+        del self.header, self.value, self.actions
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory block (by the process which created it, once all the processes closed it)."""
+        self.shm.unlink()
+
+
+if __name__ == '__main__':
+    """Serve the saved agent: publish its policy until interrupted, actors attach to it by name."""
+    from util import load_agent
+    from args import get_game_args
+    from agent import AIAgent
+
+    # get arguments needed to play the Game
+    args = get_game_args()
+    agent = AIAgent(args, None)
+    load_agent(agent, args.save_filename, mmap=True)
+
+    policy = SharedPolicy(agent.mdp_data['num_states'])
+    policy.publish(agent.mdp_data['value'], agent.mdp_data['policy'])
+    print("Policy of {} shared as: {}".format(args.save_filename, policy.name))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        policy.close()
+        policy.unlink()
@@ -0,0 +1,131 @@
+"""Headless simulation core of the Game.
+
+Authors:
+    Gael Colas
+"""
+
+import numpy as np
+
+from util import *
+from environment import Environment, PipeSchedule
+from bird import Bird
+
+
+class Simulator:
+    """Display-free simulation of the Game: the agent steps it directly with its actions.
+
+    Attributes:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+        'render' (bool, default=False): whether to build the RGB-pixel array of the environment at each time step
+        'bird' (Bird): the Bird
+        'env' (Environment): the game Environment
+        'score' (int): current score
+        't' (int): number of time steps since the beginning of the game
+        'episode' (int): number of games started
+        'stream' (tuple of int, default=(ENV_STREAM,)): key of the random stream of the games (see 'make_rng')
+
+    Remarks:
+        No display and no keyboard/mouse event is needed: the simulation can run on a machine without screen.
+        The pipes of the k-th game are drawn from the stream (*stream, k) of the master seed 'args.seed':
+        two simulations with the same seed and stream play the same sequence of games.
+    """
+
+    def __init__(self, args, render=False, stream=(ENV_STREAM,)):
+        super(Simulator).__init__()
+        self.args = args
+        self.render = render
+        self.stream = tuple(stream)
+        self.episode = 0
+
+        # start the first game (without the extra reset logic of the subclasses)
+        Simulator.reset(self)
+
+    def reset(self):
+        """Reset the environment and the bird position to start a new game.
+
+        Return:
+            'state' (np.array, [y, dx, dy, t]): the initial state of the Bird
+        """
+        self.bird = Bird(self.args)
+        pipe_schedule = PipeSchedule(self.args, make_rng(self.args.seed, *self.stream, self.episode))
+        self.env = Environment(self.args, bird=self.bird, render=self.render, pipe_schedule=pipe_schedule)
+        self.episode += 1
+        self.score = 0
+        self.t = 0
+
+        return self.env.get_state()
+
+    def fail(self):
+        """Check if we failed the current game.
+
+        Return:
+            'isCollision' (bool): indicates if we encountered an obstacle.
+
+        Remarks:
+            'geometry' collision: the bird square is checked analytically against the pipes, the floor and the window borders.
+            'raster' collision: the pixels of the bird sprite (green screen excluded) are checked against the occupancy grid.
+        """
+        rows, cols, _ = self.bird.img.shape
+        # find the top-left coordinates of bird image
+        x_b, y_b = self.bird.x + self.env.pad - cols//2, max(self.bird.y + self.env.pad - rows//2, 0)
+
+        if self.args.collision == "raster":
+            # check if the bird pixels intersect with some environment obstacles
+            occ = self.env.occ[y_b:y_b + rows, x_b:x_b + cols]
+            mask = self.bird.mask[:occ.shape[0], :occ.shape[1]]
+            isCollision = (occ[mask]).any()
+        else:
+            # check if the bird square intersects with some environment obstacles
+            isCollision = self.env.is_collision(y_b - self.env.pad, x_b - self.env.pad, rows, cols)
+
+        return isCollision
+
+    def update_score(self):
+        """Update the score when the middle of a pipe is crossed.
+
+        Return:
+            'isCrossed' (bool): indicate that the middle of the next pipe has been crossed
+        """
+        isCrossed = np.any([self.bird.x  == (pipe[0] + self.args.pipe_width//2) for pipe in self.env.pipes])
+
+        if isCrossed:
+            # update the score
+            self.score += 1
+
+        return isCrossed
+
+    def step(self, action=0):
+        """Play one time step in the game.
+
+        Args:
+            'action' (int, 0 or 1): action performed at the current time step
+                    action = 1 if jumping, 0 otherwise
+
+        Return:
+            'new_state' (np.array, [y, dx, dy, t]): the new state of the Bird
+            'isScoreUpdated' (bool): whether a point has been earned at the current time step
+            'isFail' (bool): whether the Game has been failed at the current time step
+        """
+        # update the score
+        isScoreUpdated = self.update_score()
+
+        # the player hit an obstacle
+        isFail = self.fail()
+        if isFail and self.render:
+            # display an explosion instead of the bird image
+            self.bird.set_sprite(self.args.explosion_sprite, self.args.explosion_dims)
+
+        # perform the action
+        if action == 1:
+            self.bird.jump()
+
+        # compute the new bird position
+        self.bird.move()
+
+        # scroll 1 frame and generate the new environment
+        self.env.scroll()
+
+        # new time step
+        self.t += 1
+
+        return self.env.get_state(), isScoreUpdated, isFail
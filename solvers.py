@@ -0,0 +1,263 @@
+"""Solvers computing the value function of the approximate MDP.
+
+Authors:
+    Gael Colas
+"""
+
+import numpy as np
+
+
+def greedy_policy(transitions, value):
+    """Compute the Q-values and the greedy policy of a value function.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'value' (np.array, shape=(num_states,)): value function
+
+    Return:
+        'q_values' (np.array, shape=(num_states, 2)): expected next value of each state and action
+        'policy' (np.array, shape=(num_states,), dtype=int8): greedy action in each state
+                the agent only jumps if it is strictly better: "not jumping" is more frequent
+    """
+    q_values = transitions.expected_values(value)
+    policy = (q_values[:, 1] > q_values[:, 0]).astype(np.int8)
+
+    return q_values, policy
+
+
+def value_iteration(transitions, reward, value, gamma, tolerance):
+    """Solve for the value function with (Jacobi) Value Iteration, starting from 'value'.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'reward' (np.array, shape=(num_states,)): reward function
+        'value' (np.array, shape=(num_states,)): initial value function
+        'gamma' (float): discount factor
+        'tolerance' (float): convergence criterium: largest change of the value function in a sweep
+
+    Return:
+        'value' (np.array, shape=(num_states,)): converged value function
+        'n_iter' (int): number of sweeps
+    """
+    n_iter = 0
+    while True:
+        # Q(_,a) for the different actions
+        expected_values = transitions.expected_values(value)
+
+        # Bellman update
+        new_value = reward + gamma * np.max(expected_values, axis=1)
+        n_iter += 1
+
+        # difference with previous value function
+        max_diff = np.max(np.abs(new_value - value))
+
+        value = new_value
+
+        # check for convergence
+        if max_diff < tolerance:
+            return value, n_iter
+
+
+def gauss_seidel(transitions, reward, value, gamma, tolerance, n_blocks=8):
+    """Solve for the value function with (block) Gauss-Seidel Value Iteration, starting from 'value'.
+    The states are updated block after block, in place: each block already uses the new values of the previous blocks.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'reward' (np.array, shape=(num_states,)): reward function
+        'value' (np.array, shape=(num_states,)): initial value function
+        'gamma' (float): discount factor
+        'tolerance' (float): convergence criterium: largest change of the value function in a sweep
+        'n_blocks' (int, default=8): number of blocks of contiguous states updated at once
+
+    Return:
+        'value' (np.array, shape=(num_states,)): converged value function
+        'n_iter' (int): number of sweeps
+
+    Remarks:
+        As in the Gauss-Seidel method for linear systems, the value of a state is solved for its own transitions:
+            V(x) = max_a (R(x) + gamma*sum_{x' != x} p(x'|x,a) V(x')) / (1 - gamma*p(x|x,a))
+        The Bird often stays in the same discretized state: the self-transitions would otherwise need many sweeps.
+        Updating the states one by one would need fewer sweeps, but each update would be a Python call:
+        the blocks keep most of the gain of the in-place updates with vectorized sweeps.
+    """
+    num_states = value.shape[0]
+    # contiguous blocks: the rows of a block are read through views, never copied
+    blocks = [slice(block[0], block[-1] + 1) for block in np.array_split(np.arange(num_states), min(n_blocks, num_states))]
+    self_probs = gamma * transitions.self_probs()
+    scale = 1 / (1 - self_probs)
+
+    value = value.copy()
+    diff = np.empty(num_states)
+    n_iter = 0
+    while True:
+        value_mean = value.mean()
+        for block in blocks:
+            # Bellman update of the block with the latest values, the self-transitions being solved for (in place: few temporaries)
+            new_values = gamma * transitions.expected_values(value, block, value_mean)
+            new_values -= self_probs[block] * value[block][:, np.newaxis]
+            new_values += reward[block][:, np.newaxis]
+            new_values *= scale[block]
+            new_values = new_values.max(axis=1)
+            np.subtract(new_values, value[block], out=diff[block])
+            value[block] = new_values
+
+            value_mean += diff[block].sum() / num_states
+        n_iter += 1
+
+        # check for convergence
+        if np.abs(diff).max() < tolerance:
+            return value, n_iter
+
+
+def modified_policy_iteration(transitions, reward, value, gamma, tolerance, n_sweeps=20):
+    """Solve for the value function with Modified Policy Iteration, starting from 'value'.
+    Each policy improvement (greedy policy of the current value function) is followed by 'n_sweeps' evaluation sweeps of this policy.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'reward' (np.array, shape=(num_states,)): reward function
+        'value' (np.array, shape=(num_states,)): initial value function
+        'gamma' (float): discount factor
+        'tolerance' (float): convergence criterium: largest change of the value function in a policy improvement
+        'n_sweeps' (int, default=20): number of policy evaluation sweeps after each policy improvement
+
+    Return:
+        'value' (np.array, shape=(num_states,)): converged value function
+        'n_iter' (int): number of sweeps (policy improvements and evaluations)
+
+    Remarks:
+        An evaluation sweep only reads the transitions of 1 action per state: it is about twice cheaper than a Value Iteration sweep.
+    """
+    n_iter = 0
+    while True:
+        # policy improvement: Bellman update and greedy policy
+        q_values, policy = greedy_policy(transitions, value)
+        new_value = reward + gamma * np.max(q_values, axis=1)
+        n_iter += 1
+
+        # check for convergence
+        if np.max(np.abs(new_value - value)) < tolerance:
+            return new_value, n_iter
+        value = new_value
+
+        # partial policy evaluation
+        expected_values = transitions.policy_operator(policy)
+        for k in range(n_sweeps):
+            value = reward + gamma * expected_values(value)
+        n_iter += n_sweeps
+
+
+def linear_policy_iteration(transitions, reward, value, gamma, tolerance, max_iter=100):
+    """Solve for the value function with Policy Iteration, the policies being evaluated exactly by a linear solve.
+    The first policy is the greedy policy of 'value'.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'reward' (np.array, shape=(num_states,)): reward function
+        'value' (np.array, shape=(num_states,)): initial value function
+        'gamma' (float): discount factor
+        'tolerance' (float): convergence criterium: largest Bellman error of the value function of the policy
+        'max_iter' (int, default=100): maximum number of policy evaluations
+
+    Return:
+        'value' (np.array, shape=(num_states,)): converged value function
+        'n_iter' (int): number of policy evaluations (linear solves)
+
+    Remarks:
+        The policy stops changing after a few evaluations, whatever 'gamma': the cost does not grow with the horizon 1/(1-gamma).
+        Each evaluation costs a dense (DenseTransitions) or sparse (SparseTransitions) linear solve.
+    """
+    _, policy = greedy_policy(transitions, value)
+    for n_iter in range(1, max_iter + 1):
+        # policy evaluation
+        value = transitions.solve_policy(reward, policy, gamma)
+
+        # policy improvement
+        q_values, new_policy = greedy_policy(transitions, value)
+        bellman_error = np.max(np.abs(reward + gamma * np.max(q_values, axis=1) - value))
+        if np.array_equal(new_policy, policy) or bellman_error < tolerance:
+            break
+        policy = new_policy
+
+    return value, n_iter
+
+
+def prioritized_sweeping(transitions, reward, value, gamma, tolerance, seeds, max_updates=None):
+    """Solve for the value function with Prioritized Sweeping, starting from the previous solution 'value'.
+    Only the states whose Bellman error may have changed are updated, largest errors first.
+
+    Args:
+        'transitions' (DenseTransitions or SparseTransitions): transition model
+        'reward' (np.array, shape=(num_states,)): reward function
+        'value' (np.array, shape=(num_states,)): previous value function
+        'gamma' (float): discount factor
+        'tolerance' (float): convergence criterium: largest Bellman error
+        'seeds' (np.array of int): states whose transitions or reward changed since 'value' was computed
+        'max_updates' (int, default=None): maximum number of state updates before falling back to Value Iteration
+                    (10*num_states if None)
+
+    Return:
+        'value' (np.array, shape=(num_states,)): converged value function
+        'n_iter' (float): number of Bellman updates, counted in full sweeps (num_states updates = 1 sweep)
+
+    Remarks:
+        The queue is processed by batches: all the queued states whose error is at least half of the largest error are updated at once.
+        The unobserved state-action pairs have a uniform transition prior: their expected value is the mean of the value function.
+        The states with an unobserved action are queued when this mean drifted by more than the tolerance.
+        A full sweep finally checks the convergence and re-seeds the states whose error is still too large.
+    """
+    num_states = value.shape[0]
+    if max_updates is None:
+        max_updates = 10*num_states
+
+    value = value.copy()
+    value_mean = value.mean()
+    unobserved_states = transitions.unobserved_states()
+
+    n_updates, n_sweeps = 0, 0
+    while n_updates < max_updates:
+        # queued states
+        queue = np.unique(seeds)
+        mean_drift = 0.
+
+        while queue.size > 0 and (n_updates < max_updates):
+            # Bellman errors of the queued states
+            new_values = reward[queue] + gamma * np.max(transitions.expected_values(value, queue, value_mean), axis=1)
+            errors = np.abs(new_values - value[queue])
+
+            # converged states leave the queue
+            isQueued = errors >= tolerance
+            queue, new_values, errors = queue[isQueued], new_values[isQueued], errors[isQueued]
+            if queue.size == 0:
+                break
+
+            # Bellman update of the states with the largest errors
+            isUpdated = errors >= errors.max() / 2
+            updated = queue[isUpdated]
+            change = np.sum(new_values[isUpdated] - value[updated]) / num_states
+            value[updated] = new_values[isUpdated]
+            value_mean += change
+            mean_drift += change
+            n_updates += updated.size
+
+            # the predecessors' Bellman errors changed
+            predecessors = transitions.predecessors(updated)
+            if abs(gamma * mean_drift) >= tolerance:
+                predecessors = np.concatenate([predecessors, unobserved_states])
+                mean_drift = 0.
+            queue = np.union1d(queue[~isUpdated], predecessors)
+
+        # check the convergence on all the states
+        new_value = reward + gamma * np.max(transitions.expected_values(value), axis=1)
+        n_sweeps += 1
+        seeds = np.flatnonzero(np.abs(new_value - value) >= tolerance)
+        value = new_value
+        value_mean = value.mean()
+        if seeds.size == 0:
+            return value, n_sweeps + n_updates / num_states
+
+    # too many updates: the changes are not local, finish with Value Iteration
+    value, n_iter = value_iteration(transitions, reward, value, gamma, tolerance)
+
+    return value, n_iter + n_sweeps + n_updates / num_states
@@ -0,0 +1,129 @@
+"""Headless training of the AI agent: no display and no keyboard/mouse event.
+
+Authors:
+    Gael Colas
+"""
+
+import time
+
+import numpy as np
+
+from util import *
+from args import get_game_args
+from simulator import Simulator
+from batch_environment import BatchEnvironment
+from agent import AIAgent
+from rollout import train_parallel
+
+
+def train(args):
+    """Let the AI agent play 'n_episodes' games in the headless Simulator.
+    
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+    
+    Return:
+        'agent' (AIAgent): the trained AI agent
+    """
+    # headless simulation of the Game
+    sim = Simulator(args)
+    
+    # AI agent playing the Game
+    agent = AIAgent(args, sim.env.get_state())
+    # load saved parameters
+    if args.load_save:
+        load_agent(agent, args.save_filename)
+    
+    best_score, n_steps = 0, 0
+    start = time.time()
+    for episode in range(1, args.n_episodes + 1):
+        # play one game until the bird fails
+        isFail = False
+        while not isFail:
+            action = agent.choose_action()
+            new_state, isScoreUpdated, isFail = sim.step(action)
+            agent.set_transition(new_state, isScoreUpdated, isFail)
+        
+        best_score = max(best_score, sim.score)
+        n_steps += sim.t
+        
+        if episode % args.log_every == 0:
+            elapsed = time.time() - start
+            print("Episode {}: score {} | best score {} | {:.0f} steps/s | last solve: {:.0f} iterations in {:.1f} ms".format(episode, sim.score, best_score, n_steps / elapsed, agent.n_iter, 1e3*agent.solve_time))
+        
+        # start a new game
+        agent.reset(sim.reset())
+    
+    return agent
+    
+def train_batch(args):
+    """Let the AI agent play 'n_episodes' games, 'n_games' at once in the vectorized BatchEnvironment.
+    
+    Args:
+        'args' (ArgumentParser): parser gethering all the Game parameters
+    
+    Return:
+        'agent' (AIAgent): the trained AI agent
+        
+    Remarks:
+        The approximate MDP is updated every 'n_games' finished games instead of after every game.
+    """
+    # vectorized simulation of 'n_games' games
+    batch_env = BatchEnvironment(args, args.n_games)
+    states = batch_env.get_states()
+    
+    # AI agent playing the Games
+    agent = AIAgent(args, states[0])
+    # load saved parameters
+    if args.load_save:
+        load_agent(agent, args.save_filename)
+    
+    episode, n_finished, best_score, n_steps = 0, 0, 0, 0
+    start = time.time()
+    while episode < args.n_episodes:
+        # play one time step in all the games
+        actions = agent.choose_actions(states)
+        new_states, isScoreUpdated, isFail = batch_env.step(actions)
+        agent.update_mdp_counts_batch(states, actions, new_states, isScoreUpdated, isFail)
+        n_steps += args.n_games
+        
+        # finished games
+        n_fail = np.count_nonzero(isFail)
+        if n_fail > 0:
+            best_score = max(best_score, batch_env.score[isFail].max())
+            for k in range(n_fail):
+                episode += 1
+                if episode % args.log_every == 0:
+                    elapsed = time.time() - start
+                    print("Episode {}: best score {} | {:.0f} steps/s | last solve: {:.0f} iterations in {:.1f} ms".format(episode, best_score, n_steps / elapsed, agent.n_iter, 1e3*agent.solve_time))
+                # the agent becomes more greedy after each game
+                agent.reset(None)
+            
+            # update the approximate MDP with the observations of the last 'n_games' games
+            n_finished += n_fail
+            if n_finished >= args.n_games:
+                agent.schedule_mdp_update()
+                n_finished = 0
+            
+            # start new games
+            new_states = batch_env.reset(isFail)
+        
+        states = new_states
+    
+    return agent
+    
+
+if __name__ == '__main__':
+    # get arguments needed to play the Game
+    args = get_game_args()
+    # train the AI agent
+    if args.n_workers > 1:
+        agent = train_parallel(args)
+    elif args.n_games > 1:
+        agent = train_batch(args)
+    else:
+        agent = train(args)
+    # save the AI agent parameters
+    save_agent(agent, args.save_filename, args.compress_save)
+    # write the transition log
+    agent.close()
@@ -0,0 +1,297 @@
+"""Append-only log of the raw transitions played by the AI agent, to replay them offline.
+
+Authors:
+    Gael Colas
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+import ujson as json
+
+from util import *
+from args import get_game_args
+from discretizer import STATE_AXES
+
+
+# fixed-size record of a transition: raw states [y, dx, dy, t], action, reward and failure (38 bytes)
+RECORD_DTYPE = np.dtype([
+    ('state', np.float32, (len(STATE_AXES),)),
+    ('action', np.int8),
+    ('new_state', np.float32, (len(STATE_AXES),)),
+    ('reward', np.float32),
+    ('done', np.bool_)
+])
+# name of the index of the chunks in the log directory
+LOG_INDEX = "index.json"
+
+
+class TransitionLogWriter:
+    """Buffered writer of a transition log, the records being written to the disk by a background thread.
+
+    Attributes:
+        'log_dir' (str): directory of the log
+        'chunk_size' (int): number of records of each chunk file
+        'seed' (int): master seed of the run writing the log, recorded with its chunks
+        'chunks' (list of dict, {'filename', 'n_records', 'seed'}): chunks of the log
+        'buffer' (np.array, shape=(buffer_size,), dtype=RECORD_DTYPE): records appended since the last hand-over to the writer thread
+        'n_buffered' (int): number of records in 'buffer'
+        'full_buffers', 'free_buffers' (Queue): buffers handed to the writer thread, buffers it gave back
+        'thread' (Thread): writer thread
+        'error' (Exception): error raised in the writer thread (None if no error)
+
+    Remarks:
+        The log is a directory of chunk files 'chunk_XXXXX.npy' of 'chunk_size' records, memory-mapped with 'open_memmap',
+        and of an index giving the number of records of each chunk (the last chunk is not full).
+        The index is only updated when a chunk is full and when the writer is closed: until then, the last records are not in the log.
+        Appending records never waits for the disk, unless the writer thread is 2 buffers behind.
+        An existing log is continued: its chunks are kept and new chunks are added.
+    """
+
+    def __init__(self, log_dir, seed=None, chunk_size=2**20, buffer_size=4096):
+        super(TransitionLogWriter).__init__()
+        self.log_dir = log_dir
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        os.makedirs(log_dir, exist_ok=True)
+        self.chunks = read_log_index(log_dir) if os.path.exists(os.path.join(log_dir, LOG_INDEX)) else []
+        self.chunk = None
+
+        # double buffering: the game fills a buffer while the writer thread writes the previous ones
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.n_buffered = 0
+        self.full_buffers, self.free_buffers = queue.Queue(), queue.Queue()
+        for k in range(2):
+            self.free_buffers.put(np.zeros(buffer_size, dtype=RECORD_DTYPE))
+
+        self.error = None
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, state, action, new_state, reward, done):
+        """Append a transition to the log.
+
+        Args:
+            'state' (np.array, [y, dx, dy, t]): previous state of the Bird
+            'action' (int, 0 or 1): action performed
+            'new_state' (np.array, [y, dx, dy, t]): new state of the Bird
+            'reward' (float): reward observed
+            'done' (bool): whether the Game has been failed
+        """
+        self.buffer[self.n_buffered] = (state, action, new_state, reward, done)
+        self.n_buffered += 1
+
+        if self.n_buffered == len(self.buffer):
+            self.hand_over()
+
+    def append_batch(self, states, actions, new_states, rewards, dones):
+        """Append a batch of transitions to the log.
+        Vectorized version of 'append'.
+
+        Args:
+            'states' (np.array, shape=(n, 4)): previous states of the Birds
+            'actions' (np.array, shape=(n,)): actions performed
+            'new_states' (np.array, shape=(n, 4)): new states of the Birds
+            'rewards' (np.array, shape=(n,)): rewards observed
+            'dones' (np.array, shape=(n,), dtype=bool): whether each Game has been failed
+        """
+        start = 0
+        while start < len(actions):
+            n = min(len(actions) - start, len(self.buffer) - self.n_buffered)
+            records = self.buffer[self.n_buffered:self.n_buffered + n]
+            records['state'], records['action'], records['new_state'] = states[start:start + n], actions[start:start + n], new_states[start:start + n]
+            records['reward'], records['done'] = rewards[start:start + n], dones[start:start + n]
+            self.n_buffered += n
+            start += n
+
+            if self.n_buffered == len(self.buffer):
+                self.hand_over()
+
+    def hand_over(self):
+        """Hand the buffered records over to the writer thread and take a free buffer."""
+        if self.error is not None:
+            raise self.error
+
+        self.full_buffers.put((self.buffer, self.n_buffered))
+        self.buffer = self.free_buffers.get()
+        self.n_buffered = 0
+
+    def write_loop(self):
+        """Write the buffers handed over until 'close' (in the writer thread)."""
+        for buffer, n in iter(self.full_buffers.get, None):
+            # after an error, the buffers are still given back: the game must never wait for a dead writer
+            if self.error is None:
+                try:
+                    self.write(buffer[:n])
+                except Exception as error:
+                    self.error = error
+            self.free_buffers.put(buffer)
+
+        if self.error is None:
+            self.finish_chunk()
+
+    def write(self, records):
+        """Copy records to the chunk files, starting new chunks when they are full (in the writer thread)."""
+        while len(records) > 0:
+            if self.chunk is None or self.chunks[-1]['n_records'] == self.chunk_size:
+                self.finish_chunk()
+                filename = "chunk_{:05d}.npy".format(len(self.chunks))
+                self.chunk = np.lib.format.open_memmap(os.path.join(self.log_dir, filename), mode="w+", dtype=RECORD_DTYPE, shape=(self.chunk_size,))
+                self.chunks.append({'filename': filename, 'n_records': 0, 'seed': self.seed})
+
+            start = self.chunks[-1]['n_records']
+            n = min(len(records), self.chunk_size - start)
+            self.chunk[start:start + n] = records[:n]
+            self.chunks[-1]['n_records'] += n
+            records = records[n:]
+
+    def finish_chunk(self):
+        """Flush the current chunk to the disk and add its records to the index (in the writer thread)."""
+        if self.chunk is None:
+            return
+
+        self.chunk.flush()
+        self.chunk = None
+        write_log_index(self.log_dir, self.chunks)
+
+    def close(self):
+        """Write all the appended records and stop the writer thread."""
+        if self.n_buffered > 0:
+            self.hand_over()
+        self.full_buffers.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+
+def write_log_index(log_dir, chunks):
+    """Write the index of a transition log: a temporary file is renamed, the index is never left half-written.
+
+    Args:
+        'log_dir' (str): directory of the log
+        'chunks' (list of dict, {'filename', 'n_records', 'seed'}): chunks of the log
+    """
+    fd, tmp_filename = make_temp_file(os.path.join(log_dir, LOG_INDEX))
+    with os.fdopen(fd, "w") as out_file:
+        json.dump({'dtype': RECORD_DTYPE.descr, 'chunks': chunks}, out_file)
+    os.replace(tmp_filename, os.path.join(log_dir, LOG_INDEX))
+
+def read_log_index(log_dir):
+    """Read the index of a transition log.
+
+    Return:
+        'chunks' (list of dict, {'filename', 'n_records', 'seed'}): chunks of the log
+                the chunks of former logs have no 'seed'
+    """
+    with open(os.path.join(log_dir, LOG_INDEX), "r") as in_file:
+        index = json.load(in_file)
+
+    if np.dtype([tuple(field) for field in index['dtype']]) != RECORD_DTYPE:
+        raise ValueError("The transition log {} has records {}: expected {}.".format(log_dir, index['dtype'], RECORD_DTYPE.descr))
+
+    return index['chunks']
+
+def load_log(log_dir):
+    """Memory-map the chunks of a transition log.
+
+    Args:
+        'log_dir' (str): directory of the log
+
+    Return:
+        'chunks' (list of np.array, dtype=RECORD_DTYPE): read-only records of each chunk, in the order they were played
+    """
+    return [np.load(os.path.join(log_dir, chunk['filename']), mmap_mode="r")[:chunk['n_records']] for chunk in read_log_index(log_dir)]
+
+def count_transitions(s, a, new_s, num_states):
+    """Count the occurrences of each transition `s, a, new_s` of a batch.
+
+    Args:
+        's' (np.array of int): indices of the discretized previous states
+        'a' (np.array of int): actions performed
+        'new_s' (np.array of int): indices of the discretized new states
+        'num_states' (int): the number of discretized states
+
+    Return:
+        'keys' (np.array of int, sorted): flat indices (2*s + a)*num_states + new_s of the observed transitions
+        'counts' (np.array of int): number of occurrences of each transition
+
+    Remarks:
+        The counts are accumulated with 'np.bincount' over all the flat indices when they fit in memory next to the batch,
+        and by sorting the flat indices ('np.unique') for large numbers of states.
+    """
+    keys = (2*s.astype(np.int64) + a)*num_states + new_s
+
+    if 2*num_states**2 <= max(len(keys), 2**22):
+        counts = np.bincount(keys, minlength=2*num_states**2)
+        keys = np.flatnonzero(counts)
+        return keys, counts[keys]
+
+    return np.unique(keys, return_counts=True)
+
+def rebuild_mdp(agent, log_dirs, batch_size=2**20):
+    """Record the transitions of transition logs in the approximate MDP of an agent.
+    The states are discretized with the discretization of the agent, 'batch_size' records at once.
+
+    Args:
+        'agent' (AIAgent): AI agent (only its MDP counts are updated: call 'update_mdp_parameters' to solve it)
+        'log_dirs' (list of str): directories of the logs
+        'batch_size' (int, default=2**20): number of records read from the memory-mapped chunks at once
+
+    Return:
+        'n_records' (int): number of recorded transitions
+
+    Remarks:
+        The counts of each batch are aggregated by flat index (see 'count_transitions'),
+        the MDP is only updated once with the aggregated counts of all the logs.
+    """
+    num_states = agent.mdp_data['num_states']
+    keys, counts = [], []
+    reward_sums, reward_counts = np.zeros(num_states), np.zeros(num_states)
+
+    n_records = 0
+    for log_dir in log_dirs:
+        for chunk in load_log(log_dir):
+            for start in range(0, len(chunk), batch_size):
+                records = chunk[start:start + batch_size]
+
+                # vectorized discretization of the whole batch
+                s = agent.get_closest_states_idx(records['state'])
+                new_s = agent.get_closest_states_idx(records['new_state'], records['done'])
+
+                batch_keys, batch_counts = count_transitions(s, records['action'], new_s, num_states)
+                keys.append(batch_keys)
+                counts.append(batch_counts)
+                reward_sums += np.bincount(new_s, weights=records['reward'], minlength=num_states)
+                reward_counts += np.bincount(new_s, minlength=num_states)
+                n_records += len(records)
+
+    # merge the counts of the batches
+    keys, inverse = np.unique(np.concatenate(keys or [np.zeros(0, dtype=np.int64)]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts or [np.zeros(0)]), minlength=len(keys))
+    rows, new_s = np.divmod(keys, num_states)
+
+    # a single update of the MDP counts
+    agent.mdp_data['transitions'].add(rows // 2, rows % 2, new_s, counts)
+    agent.mdp_data['reward_counts'][:, 0] += reward_sums
+    agent.mdp_data['reward_counts'][:, 1] += reward_counts
+
+    return n_records
+
+
+if __name__ == '__main__':
+    """Summarize a transition log."""
+    # get arguments needed to play the Game
+    args = get_game_args()
+    if args.transition_log is None:
+        raise ValueError("Give the directory of the transition log to summarize with '--transition_log'.")
+
+    chunks = load_log(args.transition_log)
+    n_records = sum([len(records) for records in chunks])
+    n_games = sum([int(np.count_nonzero(records['done'])) for records in chunks])
+    reward_sum = sum([float(records['reward'].sum()) for records in chunks])
+    seeds = sorted(set([chunk['seed'] for chunk in read_log_index(args.transition_log) if chunk.get('seed') is not None]))
+    print("{}: {} transitions in {} chunks | {} finished games | mean reward {:.3f} | seeds {}".format(args.transition_log, n_records, len(chunks), n_games, reward_sum / max(n_records, 1), seeds))
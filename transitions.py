@@ -0,0 +1,466 @@
+"""Transition models of the approximate MDP built by the AI agent.
+
+Authors:
+    Gael Colas
+"""
+
+import numpy as np
+
+
+def gather_rows(indptr, rows):
+    """Gather the entries of some rows of a CSR matrix.
+
+    Args:
+        'indptr' (np.array of int): CSR row pointers
+        'rows' (np.array of int): indices of the rows to gather
+
+    Return:
+        'entries' (np.array of int): indices of the entries of the gathered rows, row after row
+        'segments' (np.array of int): position in 'rows' of the row of each entry
+    """
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    segments = np.repeat(np.arange(len(rows)), lengths)
+    # offset of each entry inside its row
+    offsets = np.arange(len(segments)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    return np.repeat(starts, lengths) + offsets, segments
+
+
+class DenseTransitions:
+    """Transition model stored as dense arrays.
+
+    Attributes:
+        'num_states' (int): the number of discretized states
+        'counts' (np.array, shape=(num_states, 2, num_states)): number of times each transition `state, action, new_state` occurred
+        'probs' (np.array, shape=(num_states, 2, num_states)): transition probabilities p(x'|x,a)
+        'touched' (np.array, shape=(num_states, 2), dtype=bool): state-action pairs whose counts changed since the last 'update_probs'
+        'observed' (np.array, shape=(num_states, 2), dtype=bool): state-action pairs with at least one observed transition
+        'predecessor_mask' (np.array, shape=(num_states, num_states), dtype=bool): predecessor_mask[x', x] = whether a transition from x to x' was observed
+
+    Remarks:
+        'observed' and 'predecessor_mask' are updated with the counts: the queries of the solvers never scan 'counts'.
+        Memory is quadratic in 'num_states': use 'SparseTransitions' for fine discretizations.
+    """
+
+    backend = "dense"
+
+    def __init__(self, num_states):
+        super(DenseTransitions).__init__()
+        self.num_states = num_states
+
+        # transition probability initialized uniformly: p(x'|x,a) = 1/num_states
+        self.counts = np.zeros((num_states, 2, num_states))
+        self.probs = np.ones((num_states, 2, num_states)) / num_states
+        self.touched = np.zeros((num_states, 2), dtype=bool)
+        self.observed = np.zeros((num_states, 2), dtype=bool)
+        self.predecessor_mask = np.zeros((num_states, num_states), dtype=bool)
+
+    def add(self, s, a, new_s, count=1):
+        """Record transitions `s, a, new_s`.
+
+        Args:
+            's' (int or np.array of int): indices of the previous states
+            'a' (int or np.array of int): actions performed
+            'new_s' (int or np.array of int): indices of the new states
+            'count' (int or np.array of int, default=1): number of occurrences of each transition
+        """
+        # repeated transitions are accumulated
+        np.add.at(self.counts, (s, a, new_s), count)
+        self.touched[s, a] = True
+        self.observed[s, a] = True
+        self.predecessor_mask[new_s, s] = True
+
+    def update_probs(self):
+        """Update the transition probabilities with the transition counts.
+
+        Return:
+            'touched_states' (np.array of int): indices of the states whose transition probabilities changed
+
+        Remarks:
+            Only the state-action pairs whose counts changed are renormalized.
+        """
+        total_num_transitions = np.sum(self.counts[self.touched], axis=-1)
+        self.probs[self.touched] = self.counts[self.touched] / total_num_transitions[:, np.newaxis]
+
+        touched_states = np.flatnonzero(self.touched.any(axis=1))
+        self.touched[:] = False
+
+        return touched_states
+
+    def expected_values(self, value, s=None, value_mean=None):
+        """Expected value of the next state for each state-action pair: sum_x' p(x'|x,a) V(x').
+
+        Args:
+            'value' (np.array, shape=(num_states,)): value function
+            's' (int or np.array of int or slice, default=None): indices of the states (all the states if None)
+            'value_mean' (float, default=None): unused, the uniform prior is stored in 'probs'
+
+        Return:
+            'expected_values' (np.array, shape=(n, 2)): expected next value for each state and action
+        """
+        probs = self.probs if s is None else self.probs[s]
+
+        return probs.dot(value)
+
+    def self_probs(self):
+        """Return the probabilities of staying in the same state: p(x|x,a), shape=(num_states, 2)."""
+        return self.probs[np.arange(self.num_states), :, np.arange(self.num_states)]
+
+    def policy_operator(self, policy):
+        """Expected value of the next state when following a policy: V -> sum_x' p(x'|x,policy(x)) V(x').
+
+        Args:
+            'policy' (np.array, shape=(num_states,), dtype=int8): action in each state
+
+        Return:
+            'operator' (function): maps a value function to the expected next value of each state
+        """
+        return self.probs[np.arange(self.num_states), policy].dot
+
+    def solve_policy(self, reward, policy, gamma):
+        """Exact value function of a policy: solve the linear system (I - gamma*P_policy) V = R.
+
+        Args:
+            'reward' (np.array, shape=(num_states,)): reward function
+            'policy' (np.array, shape=(num_states,), dtype=int8): action in each state
+            'gamma' (float): discount factor
+
+        Return:
+            'value' (np.array, shape=(num_states,)): value function of the policy
+        """
+        probs = self.probs[np.arange(self.num_states), policy]
+
+        return np.linalg.solve(np.eye(self.num_states) - gamma*probs, reward)
+
+    def predecessors(self, s):
+        """Return the states from which an observed transition leads to one of the states 's'.
+
+        Args:
+            's' (np.array of int): indices of the states
+
+        Return:
+            'predecessors' (np.array of int): indices of the predecessor states
+        """
+        return np.flatnonzero(self.predecessor_mask[s].any(axis=0))
+
+    def unobserved_states(self):
+        """Return the states with an unobserved action: their transition probabilities are the uniform prior."""
+        return np.flatnonzero(~self.observed.all(axis=1))
+
+    def state_dict(self):
+        """Return the arrays describing the transition model."""
+        return {'counts': self.counts, 'probs': self.probs}
+
+    @classmethod
+    def from_state_dict(cls, num_states, state_dict):
+        """Build a transition model from the arrays returned by 'state_dict'."""
+        transitions = cls(num_states)
+        # no copy: memory-mapped arrays stay shared
+        transitions.counts = np.asarray(state_dict['counts'], dtype=float)
+        transitions.probs = np.asarray(state_dict['probs'], dtype=float)
+        # indexes of the observed transitions
+        transitions.observed = transitions.counts.sum(axis=-1) > 0
+        transitions.predecessor_mask = np.ascontiguousarray(transitions.counts.any(axis=1).T)
+
+        return transitions
+
+
+class SparseTransitions:
+    """Transition model stored as sparse counts.
+    Each state only transitions to a few neighbours: only the observed transitions are stored.
+
+    Attributes:
+        'num_states' (int): the number of discretized states
+        'counts' (dict, {row: {new_state: count}}): number of times each transition occurred
+                row = 2*state + action
+        'indptr', 'indices', 'probs' (np.array): transition probabilities of the observed transitions in CSR format
+                the probabilities of row r are 'probs[indptr[r]:indptr[r+1]]' for the new states 'indices[indptr[r]:indptr[r+1]]'
+        'rows' (np.array of int): row of each observed transition of the CSR format
+        'touched' (set of int): rows whose counts changed since the last 'update_probs'
+        'pred_indptr', 'pred_states' (np.array): reverse index of the observed transitions in CSR format
+                the predecessors of the state s are 'pred_states[pred_indptr[s]:pred_indptr[s+1]]'
+        'new_transitions' (list of tuple, (new_state, state)): transitions observed for the first time since the last 'update_probs'
+
+    Remarks:
+        'update_probs' only rebuilds the touched rows: the other rows are moved as blocks, and the new transitions are inserted in the reverse index.
+        The uniform prior p(x'|x,a) = 1/num_states of the unobserved state-action pairs is applied lazily: it is never stored.
+        Memory is linear in the number of observed transitions.
+    """
+
+    backend = "sparse"
+
+    def __init__(self, num_states):
+        super(SparseTransitions).__init__()
+        self.num_states = num_states
+
+        self.counts = {}
+        self.touched = set()
+        self.new_transitions = []
+
+        # no observed transition
+        self.indptr = np.zeros(2*num_states + 1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.probs = np.zeros(0)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.pred_indptr = np.zeros(num_states + 1, dtype=np.int64)
+        self.pred_states = np.zeros(0, dtype=np.int64)
+
+    def add(self, s, a, new_s, count=1):
+        """Record transitions `s, a, new_s`.
+
+        Args:
+            's' (int or np.array of int): indices of the previous states
+            'a' (int or np.array of int): actions performed
+            'new_s' (int or np.array of int): indices of the new states
+            'count' (int or np.array of int, default=1): number of occurrences of each transition
+        """
+        if np.ndim(s) == 0:
+            self.add_count(2*int(s) + int(a), int(new_s), count)
+            return
+
+        # aggregate the repeated transitions before updating the dictionary
+        rows = 2*np.asarray(s, dtype=np.int64) + np.asarray(a, dtype=np.int64)
+        keys, inverse = np.unique(rows*self.num_states + np.asarray(new_s, dtype=np.int64), return_inverse=True)
+        n = np.bincount(inverse.ravel(), weights=np.broadcast_to(count, inverse.shape).ravel(), minlength=len(keys)).astype(np.int64)
+        for key, count in zip(keys.tolist(), n.tolist()):
+            row, new_state = divmod(key, self.num_states)
+            self.add_count(row, new_state, count)
+
+    def add_count(self, row, new_state, count):
+        """Add 'count' occurrences of the transition from the state-action pair 'row' to 'new_state'."""
+        row_counts = self.counts.setdefault(row, {})
+        if new_state not in row_counts:
+            row_counts[new_state] = 0
+            self.new_transitions.append((new_state, row // 2))
+        row_counts[new_state] += count
+
+        self.touched.add(row)
+
+    def update_probs(self):
+        """Update the transition probabilities with the transition counts.
+
+        Return:
+            'touched_states' (np.array of int): indices of the states whose transition probabilities changed
+
+        Remarks:
+            Only the rows whose counts changed are renormalized and written to the CSR arrays.
+            Only observed transitions are stored, the other ones keep the uniform prior.
+        """
+        rows = np.sort(np.fromiter(self.touched, dtype=np.int64, count=len(self.touched)))
+        self.touched = set()
+        if len(rows) == 0:
+            return rows
+
+        # renormalize the touched rows
+        row_nnz = np.array([len(self.counts[row]) for row in rows.tolist()], dtype=np.int64)
+        new_states = np.fromiter((new_state for row in rows.tolist() for new_state in self.counts[row]), dtype=np.int64, count=row_nnz.sum())
+        counts = np.fromiter((count for row in rows.tolist() for count in self.counts[row].values()), dtype=float, count=row_nnz.sum())
+        probs = counts / np.repeat(np.add.reduceat(counts, np.cumsum(row_nnz) - row_nnz), row_nnz)
+
+        if np.array_equal(row_nnz, self.indptr[rows + 1] - self.indptr[rows]):
+            # no new transition: the touched rows are overwritten in place
+            entries, _ = gather_rows(self.indptr, rows)
+        else:
+            nnz = np.diff(self.indptr)
+            nnz[rows] = row_nnz
+            indptr = np.concatenate([[0], np.cumsum(nnz)])
+            indices, all_probs, all_rows = np.empty(indptr[-1], dtype=np.int64), np.empty(indptr[-1]), np.empty(indptr[-1], dtype=np.int64)
+
+            # the untouched rows between 2 touched rows are moved as 1 block
+            for start, end in zip([0] + (rows + 1).tolist(), rows.tolist() + [2*self.num_states]):
+                old_start, old_end, new_start = self.indptr[start], self.indptr[end], indptr[start]
+                if old_end > old_start:
+                    indices[new_start:new_start + old_end - old_start] = self.indices[old_start:old_end]
+                    all_probs[new_start:new_start + old_end - old_start] = self.probs[old_start:old_end]
+                    all_rows[new_start:new_start + old_end - old_start] = self.rows[old_start:old_end]
+
+            self.indptr, self.indices, self.probs, self.rows = indptr, indices, all_probs, all_rows
+            entries, _ = gather_rows(self.indptr, rows)
+            self.rows[entries] = np.repeat(rows, row_nnz)
+        self.indices[entries], self.probs[entries] = new_states, probs
+
+        # insert the new transitions in the reverse index, sorted by new state
+        if self.new_transitions:
+            new_transitions = np.array(self.new_transitions, dtype=np.int64)
+            new_transitions = new_transitions[np.argsort(new_transitions[:, 0], kind='stable')]
+            self.pred_states = np.insert(self.pred_states, self.pred_indptr[new_transitions[:, 0] + 1], new_transitions[:, 1])
+            self.pred_indptr[1:] += np.cumsum(np.bincount(new_transitions[:, 0], minlength=self.num_states))
+            self.new_transitions = []
+
+        return np.unique(rows // 2)
+
+    def expected_values(self, value, s=None, value_mean=None):
+        """Expected value of the next state for each state-action pair: sum_x' p(x'|x,a) V(x').
+
+        Args:
+            'value' (np.array, shape=(num_states,)): value function
+            's' (int or np.array of int or slice, default=None): indices of the states (all the states if None)
+            'value_mean' (float, default=None): mean of 'value' if already known
+
+        Return:
+            'expected_values' (np.array, shape=(n, 2)): expected next value for each state and action
+        """
+        # expected value under the uniform prior of the unobserved state-action pairs
+        if value_mean is None:
+            value_mean = value.mean()
+
+        # contiguous states: their rows are a contiguous range of entries
+        if isinstance(s, slice):
+            first_row, last_row = 2*s.start, 2*s.stop
+            entries = slice(self.indptr[first_row], self.indptr[last_row])
+            expected_values = np.bincount(self.rows[entries] - first_row, weights=self.probs[entries]*value[self.indices[entries]], minlength=last_row - first_row).astype(float, copy=False)
+            # unobserved state-action pairs: uniform prior
+            expected_values[self.indptr[first_row + 1:last_row + 1] == self.indptr[first_row:last_row]] = value_mean
+
+            return expected_values.reshape(-1, 2)
+
+        # single state: only read its 2 rows
+        if s is not None and np.ndim(s) == 0:
+            expected_values = np.empty(2)
+            for a in range(2):
+                start, end = self.indptr[2*s + a], self.indptr[2*s + a + 1]
+                expected_values[a] = self.probs[start:end].dot(value[self.indices[start:end]]) if end > start else value_mean
+
+            return expected_values
+
+        if s is None:
+            expected_values = np.bincount(self.rows, weights=self.probs*value[self.indices], minlength=2*self.num_states).astype(float, copy=False)
+            isUnobserved = self.indptr[1:] == self.indptr[:-1]
+        
+        # only read the rows of the states
+        else:
+            rows = (2*np.asarray(s)[:, np.newaxis] + np.arange(2)).ravel()
+            entries, segments = gather_rows(self.indptr, rows)
+            expected_values = np.bincount(segments, weights=self.probs[entries]*value[self.indices[entries]], minlength=len(rows)).astype(float, copy=False)
+            isUnobserved = self.indptr[rows + 1] == self.indptr[rows]
+        
+        # unobserved state-action pairs: uniform prior
+        expected_values[isUnobserved] = value_mean
+
+        return expected_values.reshape(-1, 2)
+
+    def self_probs(self):
+        """Return the probabilities of staying in the same state: p(x|x,a), shape=(num_states, 2)."""
+        isSelf = self.indices == self.rows // 2
+        self_probs = np.bincount(self.rows[isSelf], weights=self.probs[isSelf], minlength=2*self.num_states)
+        # unobserved state-action pairs: uniform prior
+        self_probs[self.indptr[1:] == self.indptr[:-1]] = 1 / self.num_states
+
+        return self_probs.reshape(-1, 2)
+
+    def policy_rows(self, policy):
+        """Gather the observed transitions of a policy.
+
+        Args:
+            'policy' (np.array, shape=(num_states,), dtype=int8): action in each state
+
+        Return:
+            'states', 'new_states', 'probs' (np.array): transition probabilities p(x'|x,policy(x)) of the observed transitions in COO format
+            'isUnobserved' (np.array, shape=(num_states,), dtype=bool): states whose action is unobserved (uniform prior)
+        """
+        rows = 2*np.arange(self.num_states) + policy
+        entries, states = gather_rows(self.indptr, rows)
+        isUnobserved = self.indptr[rows + 1] == self.indptr[rows]
+
+        return states, self.indices[entries], self.probs[entries], isUnobserved
+
+    def policy_operator(self, policy):
+        """Expected value of the next state when following a policy: V -> sum_x' p(x'|x,policy(x)) V(x').
+
+        Args:
+            'policy' (np.array, shape=(num_states,), dtype=int8): action in each state
+
+        Return:
+            'operator' (function): maps a value function to the expected next value of each state
+        """
+        states, new_states, probs, isUnobserved = self.policy_rows(policy)
+
+        def operator(value):
+            expected_values = np.bincount(states, weights=probs*value[new_states], minlength=self.num_states).astype(float, copy=False)
+            # unobserved actions: uniform prior
+            expected_values[isUnobserved] = value.mean()
+            return expected_values
+
+        return operator
+
+    def solve_policy(self, reward, policy, gamma):
+        """Exact value function of a policy: solve the sparse linear system (I - gamma*P_policy) V = R.
+
+        Args:
+            'reward' (np.array, shape=(num_states,)): reward function
+            'policy' (np.array, shape=(num_states,), dtype=int8): action in each state
+            'gamma' (float): discount factor
+
+        Return:
+            'value' (np.array, shape=(num_states,)): value function of the policy
+
+        Remarks:
+            Requires scipy (listed in requirements.txt).
+            The uniform prior of the unobserved actions is a rank-one term: it is handled by the Sherman-Morrison formula,
+            the factorized matrix only holds the observed transitions.
+        """
+        from scipy.sparse import csc_matrix, identity
+        from scipy.sparse.linalg import splu
+
+        states, new_states, probs, isUnobserved = self.policy_rows(policy)
+        lu = splu(csc_matrix(identity(self.num_states) - gamma*csc_matrix((probs, (states, new_states)), shape=(self.num_states, self.num_states))))
+
+        # (A - gamma*u*1^T/num_states) V = R, with A the observed part and u the states with an unobserved action
+        value = lu.solve(reward.astype(float))
+        if isUnobserved.any():
+            correction = lu.solve(isUnobserved.astype(float))
+            value += correction * (gamma*value.mean()) / (1 - gamma*correction.mean())
+
+        return value
+
+    def predecessors(self, s):
+        """Return the states from which an observed transition leads to one of the states 's'.
+
+        Args:
+            's' (np.array of int): indices of the states
+
+        Return:
+            'predecessors' (np.array of int): indices of the predecessor states
+        """
+        entries, _ = gather_rows(self.pred_indptr, np.asarray(s))
+
+        return np.unique(self.pred_states[entries])
+
+    def unobserved_states(self):
+        """Return the states with an unobserved action: their transition probabilities are the uniform prior."""
+        return np.flatnonzero((self.indptr[1:] == self.indptr[:-1]).reshape(self.num_states, 2).any(axis=1))
+
+    def state_dict(self):
+        """Return the arrays describing the transition model: observed transitions in COO format."""
+        rows = np.array([row for row in self.counts for _ in self.counts[row]], dtype=np.int64)
+        new_states = np.array([new_state for row in self.counts for new_state in self.counts[row]], dtype=np.int64)
+        counts = np.array([count for row in self.counts for count in self.counts[row].values()], dtype=float)
+
+        return {'rows': rows, 'new_states': new_states, 'counts': counts}
+
+    @classmethod
+    def from_state_dict(cls, num_states, state_dict):
+        """Build a transition model from the arrays returned by 'state_dict'."""
+        transitions = cls(num_states)
+        for row, new_state, count in zip(np.asarray(state_dict['rows'], dtype=np.int64).tolist(), np.asarray(state_dict['new_states'], dtype=np.int64).tolist(), np.asarray(state_dict['counts']).tolist()):
+            transitions.add_count(row, new_state, count)
+        transitions.update_probs()
+
+        return transitions
+
+
+# transition model classes by backend name
+TRANSITIONS = {"dense": DenseTransitions, "sparse": SparseTransitions}
+
+
+def make_transitions(backend, num_states):
+    """Build an empty transition model.
+
+    Args:
+        'backend' (str, "dense" or "sparse"): storage of the transition model
+        'num_states' (int): the number of discretized states
+
+    Return:
+        'transitions' (DenseTransitions or SparseTransitions): transition model with uniform transition probabilities
+    """
+    return TRANSITIONS[backend](num_states)
@@ -4,11 +4,46 @@ Authors:
     Gael Colas
 """
 
+import os
+import struct
+import tempfile
+import zlib
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
 import ujson as json
 
+from transitions import TRANSITIONS
+from discretizer import Discretizer, STATE_AXES
+from solvers import greedy_policy
+
+
+# binary checkpoint format of the agent parameters
+CHECKPOINT_MAGIC = b"FLAPCKPT"
+CHECKPOINT_VERSION = 1
+# arrays start on cache line boundaries
+CHECKPOINT_ALIGNMENT = 64
+
+# independent random streams derived from the master seed 'args.seed'
+ENV_STREAM, AGENT_STREAM, BATCH_STREAM, WORKER_STREAM = 0, 1, 2, 3
+
+
+def make_rng(seed, *keys):
+    """Build the random generator of a stream derived from the master seed.
+    
+    Args:
+        'seed' (int): master seed (see '--seed')
+        'keys' (int): path of the stream in the tree of streams, e.g. (ENV_STREAM, episode)
+    
+    Return:
+        'rng' (np.random.Generator): random generator of the stream
+        
+    Remarks:
+        The streams of different keys are statistically independent: no stream shares the global state 'np.random'.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=keys))
 
 def jpg2numpy(im_path, im_dims):
     """Load a JPG image into a numpy array and reshape it to the correct dimensions.
@@ -18,7 +53,7 @@ def jpg2numpy(im_path, im_dims):
         'im_dims' (tuple: (rows, cols)): dimensions of the output array
     
     Return:
-        'im_array' (np.array, shape=(im_dims,3)): corresponding array of RGB-pixels
+        'im_array' (np.array, shape=(im_dims,3), dtype=uint8): corresponding C-contiguous array of RGB-pixels
     """
     # read image into numpy array
     im_array = cv2.imread(im_path)
@@ -29,11 +64,37 @@ def jpg2numpy(im_path, im_dims):
     
     # resize to match dimension requirements: OpenCV convention (cols, rows)
     im_array = cv2.resize(im_array, dsize=(im_dims[1], im_dims[0]), interpolation=cv2.INTER_CUBIC)
-    # convert from OpenCV BGR to RGB pixel convention
-    im_array = np.flip(im_array, axis=-1)
+    # convert from OpenCV BGR to RGB pixel convention: copy into a C-contiguous array instead of a flipped view
+    im_array = cv2.cvtColor(im_array, cv2.COLOR_BGR2RGB)
     
     return im_array
     
+def load_sprite(im_path, im_dims):
+    """Load a sprite and its green-screen mask, resized to the given dimensions.
+    The sprites are loaded once per process and shared by all the Birds and Environments.
+    
+    Args:
+        'im_path' (Path): path to the JPG image
+        'im_dims' (tuple: (rows, cols)): dimensions of the output array
+    
+    Return:
+        'im_array' (np.array, shape=(im_dims,3), dtype=uint8): read-only C-contiguous array of RGB-pixels
+        'mask' (np.array, shape=(im_dims), dtype=bool): read-only boolean mask indicating the non-green screen pixels
+    """
+    return _load_sprite(im_path, tuple(im_dims))
+
+@lru_cache(maxsize=None)
+def _load_sprite(im_path, im_dims):
+    """Cached implementation of 'load_sprite': the arguments must be hashable."""
+    im_array = jpg2numpy(im_path, im_dims)
+    mask = green_screen(im_array)
+    
+    # shared arrays: prevent in-place modifications
+    im_array.setflags(write=False)
+    mask.setflags(write=False)
+    
+    return im_array, mask
+    
 def green_screen(im_array):
     """Find which pixels of an input image correspond to an object on a green screen.
     
@@ -122,36 +183,226 @@ def update_score(highscore, highscore_filename):
     with open(highscore_filename, "w") as highscore_file:
         highscore_file.write("human {}\nai {}".format(highscore[0], highscore[1]))
         
-def save_agent(agent, out_filename):
-    """Save the agent parameters to a JSON file.
+def make_temp_file(out_filename):
+    """Create a temporary file next to 'out_filename', to be renamed to 'out_filename' once written.
+    
+    Args:
+        'out_filename' (str): name of the file the temporary file will replace
+        
+    Return:
+        'fd' (int): file descriptor of the temporary file, opened for writing
+        'tmp_filename' (str): name of the temporary file
+        
+    Remarks:
+        'tempfile.mkstemp' creates owner-only files: the permissions are set as by 'open' (0o666 masked by the umask),
+        so that the renamed file can be read by other users (e.g. policy-serving processes memory-mapping a checkpoint).
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=out_dir, prefix=".tmp_", suffix=os.path.basename(out_filename))
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_filename, 0o666 & ~umask)
+    
+    return fd, tmp_filename
+    
+def save_checkpoint(out_filename, metadata, arrays, compress=False):
+    """Save arrays to a binary checkpoint file.
+    
+    Args:
+        'out_filename' (str): name of the output file
+        'metadata' (dict): JSON serializable description of the arrays
+        'arrays' (dict, {name: np.array}): arrays to save
+        'compress' (bool, default=False): whether to compress the arrays with zlib
+        
+    Remarks:
+        Layout of the file:
+            - 'CHECKPOINT_MAGIC', the format version and the header length (uint32, little-endian) ;
+            - a JSON header with the 'metadata' and the dtype, shape, offset and size of each array ;
+            - the raw bytes of each array, in C order, starting on a 'CHECKPOINT_ALIGNMENT' boundary.
+        Uncompressed arrays can be memory-mapped by 'load_checkpoint'.
+        The file is written to a temporary file and then renamed: an existing checkpoint is never left half-written.
+    """
+    # raw bytes of the arrays and their position relatively to the end of the header
+    arrays_info, buffers, offset = {}, [], 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        data = zlib.compress(array.tobytes()) if compress else array.tobytes()
+        arrays_info[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset, 'nbytes': len(data), 'compressed': compress}
+        buffers.append((offset, data))
+        offset = _align(offset + len(data))
+    
+    header = json.dumps({'metadata': metadata, 'arrays': arrays_info}).encode()
+    data_start = _align(len(CHECKPOINT_MAGIC) + 8 + len(header))
+    
+    # write to a temporary file in the same directory, then atomically replace the checkpoint
+    fd, tmp_filename = make_temp_file(out_filename)
+    try:
+        with os.fdopen(fd, "wb") as out_file:
+            out_file.write(CHECKPOINT_MAGIC + struct.pack("<II", CHECKPOINT_VERSION, len(header)) + header)
+            for offset, data in buffers:
+                out_file.seek(data_start + offset)
+                out_file.write(data)
+            out_file.truncate(data_start + _align(max([offset + len(data) for offset, data in buffers], default=0)))
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        os.replace(tmp_filename, out_filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    
+def load_checkpoint(in_filename, mmap=False):
+    """Load the arrays of a binary checkpoint file written by 'save_checkpoint'.
+    
+    Args:
+        'in_filename' (str): name of the input file
+        'mmap' (bool, default=False): whether to memory-map the uncompressed arrays instead of reading them
+        
+    Return:
+        'metadata' (dict): description of the arrays
+        'arrays' (dict, {name: np.array}): saved arrays
+                memory-mapped arrays are read-only and can be shared by several processes
+    """
+    with open(in_filename, "rb") as in_file:
+        magic = in_file.read(len(CHECKPOINT_MAGIC))
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError("The file {} is not a checkpoint.".format(in_filename))
+        version, header_len = struct.unpack("<II", in_file.read(8))
+        if version > CHECKPOINT_VERSION:
+            raise ValueError("The checkpoint {} has version {}: only versions up to {} are supported.".format(in_filename, version, CHECKPOINT_VERSION))
+        header = json.loads(in_file.read(header_len).decode())
+        data_start = _align(len(CHECKPOINT_MAGIC) + 8 + header_len)
+        
+        arrays = {}
+        for name, info in header['arrays'].items():
+            dtype, shape = np.dtype(info['dtype']), tuple(info['shape'])
+            if mmap and not info['compressed']:
+                arrays[name] = np.memmap(in_filename, dtype=dtype, mode="r", offset=data_start + info['offset'], shape=shape) if np.prod(shape) > 0 else np.zeros(shape, dtype=dtype)
+                continue
+            
+            in_file.seek(data_start + info['offset'])
+            data = in_file.read(info['nbytes'])
+            if info['compressed']:
+                data = zlib.decompress(data)
+            arrays[name] = np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+    
+    return header['metadata'], arrays
+
+def is_checkpoint(filename):
+    """Check whether a file is a binary checkpoint (or a legacy JSON save)."""
+    with open(filename, "rb") as in_file:
+        return in_file.read(len(CHECKPOINT_MAGIC)) == CHECKPOINT_MAGIC
+
+def _align(n):
+    """Round 'n' up to the next multiple of 'CHECKPOINT_ALIGNMENT'."""
+    return -(-n // CHECKPOINT_ALIGNMENT) * CHECKPOINT_ALIGNMENT
+
+def save_agent(agent, out_filename, compress=False):
+    """Save the agent parameters to a binary checkpoint file.
     
     Args:
         'agent' (AIAgent): AI agent to save
         'out_filename' (str): name of the output file
+        'compress' (bool, default=False): whether to compress the arrays (the checkpoint can no longer be memory-mapped)
     """
-    with open(out_filename, "w") as out_file:
-        json.dump(agent.mdp_data, out_file)
+    # the solve in progress owns the counts
+    agent.wait_mdp_update()
+    
+    metadata = {
+        'num_states': agent.mdp_data['num_states'],
+        'state_axes': agent.mdp_data['state_axes'],
+        'n_grids': len(agent.mdp_data['state_discretization']),
+        'mdp_backend': agent.mdp_data['transitions'].backend,
+        # master seed of the run, to reproduce it
+        'seed': agent.args.seed
+    }
+    arrays = {'state_discretization/{}'.format(i): states for i, states in enumerate(agent.mdp_data['state_discretization'])}
+    arrays.update({'transitions/' + key: array for key, array in agent.mdp_data['transitions'].state_dict().items()})
+    arrays.update({key: agent.mdp_data[key] for key in ('reward_counts', 'reward', 'value', 'q_values', 'policy')})
+    
+    save_checkpoint(out_filename, metadata, arrays, compress)
     
     print("The AI agent has been saved to: {}".format(out_filename))
     
-def load_agent(agent, in_filename):
-    """Load the saved agent parameters from a JSON file.
+def load_agent(agent, in_filename, mmap=False):
+    """Load the saved agent parameters from a binary checkpoint file (or a legacy JSON file).
     
     Args:
         'agent' (AIAgent): AI agent to load the parameters into
         'in_filename' (str): name of the input file
+        'mmap' (bool, default=False): whether to memory-map the arrays of the checkpoint
+                the model is then read-only: it can be used to play, not to be trained further
+    """
+    if is_checkpoint(in_filename):
+        metadata, arrays = load_checkpoint(in_filename, mmap)
+    else:
+        metadata, arrays = load_json_save(in_filename)
+    
+    num_states = metadata['num_states']
+    agent.mdp_data = {
+        'num_states': num_states,
+        'state_axes': metadata['state_axes'],
+        'state_discretization': [arrays['state_discretization/{}'.format(i)] for i in range(metadata['n_grids'])],
+        'transitions': TRANSITIONS[metadata['mdp_backend']].from_state_dict(num_states, {key[len('transitions/'):]: array for key, array in arrays.items() if key.startswith('transitions/')}),
+        'reward_counts': arrays['reward_counts'],
+        'reward': arrays['reward'],
+        'value': arrays['value']
+    }
+    # greedy policy: recomputed if not saved
+    if 'policy' in arrays:
+        agent.mdp_data['q_values'], agent.mdp_data['policy'] = arrays['q_values'], arrays['policy']
+    else:
+        agent.mdp_data['q_values'], agent.mdp_data['policy'] = greedy_policy(agent.mdp_data['transitions'], agent.mdp_data['value'])
+    # the saved discretization replaces the one given by the arguments
+    state_axes, n_states = tuple(agent.mdp_data['state_axes']), tuple(len(states) for states in agent.mdp_data['state_discretization'])
+    if (state_axes, n_states) != (agent.state_axes, agent.n_states):
+        print("The saved discretization (state_axes={}, n_states={}) replaces the one given by the arguments.".format(state_axes, n_states))
+    agent.state_axes, agent.n_states = state_axes, n_states
+    agent.discretizer = Discretizer(agent.mdp_data['state_discretization'], [STATE_AXES.index(axis) for axis in agent.state_axes])
+    # the index of the current state was computed with the discretization given by the arguments
+    if agent.state is not None:
+        agent.state_idx = agent.get_closest_state_idx(agent.state)
+    print("The AI agent has been loaded from: {}".format(in_filename))
+
+def load_json_save(in_filename):
+    """Read the agent parameters saved in the former JSON format.
+    
+    Args:
+        'in_filename' (str): name of the input file
+        
+    Return:
+        'metadata' (dict): description of the arrays, as saved by 'save_agent'
+        'arrays' (dict, {name: np.array}): saved arrays, as saved by 'save_agent'
+        
+    Remarks:
+        Every JSON format written before the binary checkpoints is converted:
+            - the first saves stored the dense transition counts and probabilities ('transition_counts', 'transition_probs') ;
+            - then the transition model of the chosen backend ('mdp_backend', 'transitions') ;
+            - then the discretized axes of the state ('state_axes').
+        Without 'state_axes', the grids of (y, dx, dy) were stored but only (dx, dy) was discretized.
     """
     with open(in_filename, "r") as in_file:
         mdp_data = json.load(in_file)
     
-    # convert all the list to np.arrays
-    agent.mdp_data = {
+    if 'transitions' not in mdp_data and 'transition_counts' not in mdp_data:
+        raise ValueError("{} is not a saved agent: no transition model found.".format(in_filename))
+    
+    grids = mdp_data['state_discretization']
+    if 'state_axes' not in mdp_data:
+        # the y-axis grid was stored but not used
+        mdp_data['state_axes'], grids = ["dx", "dy"], grids[-2:]
+    if 'transitions' not in mdp_data:
+        mdp_data['mdp_backend'] = "dense"
+        mdp_data['transitions'] = {'counts': mdp_data['transition_counts'], 'probs': mdp_data['transition_probs']}
+    
+    metadata = {
         'num_states': mdp_data['num_states'],
-        'state_discretization': [np.array(states_list) for states_list in mdp_data['state_discretization']],
-        'transition_counts': np.array(mdp_data['transition_counts']),
-        'transition_probs': np.array(mdp_data['transition_probs']),
-        'reward_counts': np.array(mdp_data['reward_counts']),
-        'reward': np.array(mdp_data['reward']),
-        'value': np.array(mdp_data['value'])
+        'state_axes': mdp_data['state_axes'],
+        'n_grids': len(grids),
+        'mdp_backend': mdp_data['mdp_backend']
     }
-    print("The AI agent has been loaded from: {}".format(in_filename))
+    arrays = {'state_discretization/{}'.format(i): np.array(states) for i, states in enumerate(grids)}
+    arrays.update({'transitions/' + key: np.array(array) for key, array in mdp_data['transitions'].items()})
+    arrays.update({key: np.array(mdp_data[key], dtype=float) for key in ('reward_counts', 'reward', 'value')})
+    
+    return metadata, arrays